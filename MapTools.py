@@ -24,10 +24,8 @@ Toscana - S.I.T.A. (http://www.regione.toscana.it/territorio/cartografia/index.h
 """
 
 from qgis.PyQt.QtCore import Qt, pyqtSignal
-from qgis.PyQt.QtGui import QCursor
-from qgis.PyQt.QtWidgets import QApplication
 
-from qgis.core import QgsWkbTypes, QgsFeatureRequest, QgsRectangle, QgsGeometry, QgsFeature, QgsSettings, Qgis
+from qgis.core import QgsWkbTypes, QgsFeatureRequest, QgsRectangle, QgsGeometry, QgsSettings, Qgis
 from qgis.gui import QgsMapToolEmitPoint, QgsMapTool, QgsRubberBand
 
 
@@ -197,10 +195,9 @@ class FeatureFinder(MapToolEmitPoint):
 		self.stopCapture()
 		self.pointEmitted.emit(point, button)
 
-	@classmethod
-	def findAtPoint(self, layer, point, canvas, onlyTheClosestOne=True, onlyIds=False):
-		QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
-
+	@staticmethod
+	def searchArea(layer, point, canvas):
+		""" return the search rectangle around a click and the clicked point, in layer coordinates """
 		# recupera il valore del raggio di ricerca
 		settings = QgsSettings()
 		radius = settings.value( "/Map/searchRadiusMM", Qgis.DEFAULT_SEARCH_RADIUS_MM, type=float)
@@ -215,48 +212,44 @@ class FeatureFinder(MapToolEmitPoint):
 		rect.setYMinimum(point.y() - radius)
 		rect.setYMaximum(point.y() + radius)
 		rect = canvas.mapSettings().mapToLayerCoordinates(layer, rect)
+		center = canvas.mapSettings().mapToLayerCoordinates(layer, point)
+		return rect, center
 
-		# recupera le feature che intersecano il rettangolo
-		ret = None
-
-		if onlyTheClosestOne:
-			request=QgsFeatureRequest()
-			request.setFilterRect(rect)
-
-			minDist = -1
-			featureId = None
-			rect = QgsGeometry.fromRect(rect)
-			count = 0
-
-			for f in layer.getFeatures(request):
-				if onlyTheClosestOne:
-					geom = f.geometry()
-					distance = geom.distance(rect)
-					if minDist < 0 or distance < minDist:
-						minDist = distance
-						featureId = f.id()
-
-			if onlyIds:
-				ret = featureId
-			elif featureId != None:
-				f = QgsFeature()
-				feats = layer.getFeature( QgsFeatureRequest(featureId) )
-				feats.nextFeature(f)
-				ret = f
-
-		else:
-			IDs = []
-			for f in layer.getFeatures():
-				IDs.append( f.id() )
+	@classmethod
+	def closestFeatureId(cls, features, rect, center, points=None):
+		"""
+		return the id of the feature closest to center within rect, features is
+		the layer or a QgsVectorLayerFeatureSource readable out of the GUI thread
+		"""
+		if points is not None:
+			# coordinates already known (fids, x, y arrays), no need to
+			# materialize a geometry for each feature
+			return cls._closestInArrays(points, rect, center)
+
+		request=QgsFeatureRequest()
+		request.setFilterRect(rect)
+
+		minDist = -1
+		featureId = None
+		rect = QgsGeometry.fromRect(rect)
+
+		for f in features.getFeatures(request):
+			geom = f.geometry()
+			distance = geom.distance(rect)
+			if minDist < 0 or distance < minDist:
+				minDist = distance
+				featureId = f.id()
+		return featureId
+
+	@staticmethod
+	def _closestInArrays(points, rect, center):
+		import numpy as np
+		fids, x, y = points
+
+		# keep the points within the search rectangle
+		inRect = np.flatnonzero( (x >= rect.xMinimum()) & (x <= rect.xMaximum()) & (y >= rect.yMinimum()) & (y <= rect.yMaximum()) )
+		if len(inRect) == 0:
+			return None
 
-			if onlyIds:
-				ret = IDs
-			else:
-				ret = []
-				request = QgsFeatureRequest()
-				QgsFeatureRequest.setFilterFids(IDs)
-				for f in layer.getFeatures( request ):
-					ret.append( f )
-
-		QApplication.restoreOverrideCursor()
-		return ret
+		dist = (x[inRect] - center.x())**2 + (y[inRect] - center.y())**2
+		return int( fids[ inRect[ np.argmin(dist) ] ] )
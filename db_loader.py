@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import re
+import time
+import sqlite3
+import numpy as np
+
+from .text_dumps import CHUNK_SIZE, ImportStats, readHeader, iterChunks, parseTableChunk, decodeEWKBPoints
+
+try:
+	from qgis.utils import spatialite_connect
+except ImportError:
+	spatialite_connect = None
+
+
+# values stored as NULL
+NULL_VALUES = [b'', b'None', b'NULL', b'\\N']
+
+# the database is written to a temporary file replaced at the end, so
+# nothing is lost if the load is interrupted without a journal
+BULK_PRAGMAS = (
+	"PRAGMA journal_mode=OFF",
+	"PRAGMA synchronous=OFF",
+	"PRAGMA locking_mode=EXCLUSIVE",
+	"PRAGMA temp_store=MEMORY",
+	"PRAGMA cache_size=-262144",
+)
+
+DEFAULT_PRAGMAS = (
+	"PRAGMA journal_mode=DELETE",
+	"PRAGMA synchronous=FULL",
+	"PRAGMA locking_mode=NORMAL",
+)
+
+
+def connectSpatialite(path):
+	""" open a SQLite database with the SpatiaLite functions loaded """
+	if spatialite_connect is not None:
+		return spatialite_connect(path)
+
+	conn = sqlite3.connect(path)
+	try:
+		conn.enable_load_extension(True)
+		conn.load_extension("mod_spatialite")
+	except (AttributeError, sqlite3.OperationalError) as e:
+		conn.close()
+		raise RuntimeError( "unable to load mod_spatialite: %s" % e )
+	return conn
+
+
+def tableName(path):
+	""" return the table name for a dump file, e.g. all_asce for all_asce.txt """
+	name = os.path.splitext( os.path.basename(path) )[0].lower()
+	return re.sub(r"\W", "_", name)
+
+
+def _quote(name):
+	return '"%s"' % name.replace('"', '""')
+
+
+# numeric SQL types, from the narrowest one
+NUMERIC_TYPES = (('INTEGER', np.int64), ('REAL', np.float64))
+
+
+def _convertColumn(raw, sqlType=None):
+	"""
+	return the SQL type and the list of Python values of a column of bytes.
+	The values are converted to sqlType, or to the first wider type they
+	fit if they don't, the type is guessed if sqlType is None
+	"""
+	raw = np.char.strip(raw)
+	nulls = np.isin(raw, NULL_VALUES)
+	filled = np.where(nulls, b'0', raw)
+
+	values = None
+	numeric = [name for name, dtype in NUMERIC_TYPES]
+	start = 0 if sqlType is None else (numeric.index(sqlType) if sqlType in numeric else len(numeric))
+	for sqlType, dtype in NUMERIC_TYPES[start:]:
+		try:
+			values = filled.astype(dtype).tolist()
+			break
+		except (ValueError, OverflowError):
+			pass
+	if values is None:
+		sqlType = 'TEXT'
+		values = np.char.decode(raw, 'utf-8').tolist()
+
+	for row in np.flatnonzero(nulls):
+		values[row] = None
+	return sqlType, values
+
+
+def _loadTable(conn, path, table, textFields=(), geometryField=None, chunkSize=CHUNK_SIZE, report=None):
+	"""
+	Create a table from a tab-delimited dump and fill it a chunk at a time,
+	each chunk is inserted by a single executemany in its own transaction.
+	The column types are guessed from the first chunk and the next chunks
+	are converted to them (a value that doesn't fit keeps a wider type, as
+	SQLite allows). The geometry column (hex EWKB points) is added with
+	the SRID of its first value.
+	Return the names of the columns, none if the dump has no rows: the
+	table isn't created then.
+	"""
+	names, headerLength = readHeader(path)
+	attrNames = [name for name in names if name != geometryField]
+	insert = types = None
+
+	for offset, block in iterChunks(path, chunkSize, headerLength):
+		raw = parseTableChunk(block)
+		if raw.shape[1] != len(names):
+			raise ValueError( "%s: %d columns found, %d expected" % (path, raw.shape[1], len(names)) )
+
+		columns, chunkTypes = [], []
+		geometry = None
+		for idx, name in enumerate(names):
+			if name == geometryField:
+				geometry = decodeEWKBPoints( raw[:, idx] )
+				continue
+			if types is not None:
+				sqlType = types[ len(columns) ]
+			else:
+				sqlType = 'TEXT' if name in textFields else None
+			sqlType, values = _convertColumn( raw[:, idx], sqlType )
+			columns.append( values )
+			chunkTypes.append( sqlType )
+
+		if geometry is not None:
+			x, y, srid = geometry
+			# missing coordinates become NULL geometries
+			columns.append( np.where( np.isnan(x), None, x ).tolist() )
+			columns.append( np.where( np.isnan(y), None, y ).tolist() )
+
+		if insert is None:
+			types = chunkTypes
+			definition = ", ".join( "%s %s" % (_quote(name), sqlType) for name, sqlType in zip(attrNames, types) )
+			conn.execute( "CREATE TABLE %s (%s)" % (_quote(table), definition) )
+
+			placeholders = ["?"] * len(attrNames)
+			insertNames = [_quote(name) for name in attrNames]
+			if geometry is not None:
+				srids = geometry[2][ geometry[2] != 0 ]
+				srid = int(srids[0]) if len(srids) else -1
+				conn.execute( "SELECT AddGeometryColumn(?, ?, ?, 'POINT', 'XY')", (table, geometryField, srid) )
+				placeholders.append( "MakePoint(?, ?, %d)" % srid )
+				insertNames.append( _quote(geometryField) )
+			insert = "INSERT INTO %s (%s) VALUES (%s)" % (_quote(table), ", ".join(insertNames), ", ".join(placeholders))
+
+		conn.executemany( insert, zip(*columns) )
+		conn.commit()
+
+		if report:
+			report( table, len(raw), raw[:, names.index('dataripresa')] if 'dataripresa' in names else None )
+
+	return names if insert is not None else []
+
+
+def loadDumps(dbPath, psPath, tsPath, psTable=None, tsTable=None, geometryField="the_geom", chunkSize=CHUNK_SIZE, progress=None):
+	"""
+	Load a PS delivery (all_*.txt with the points and ts_all_*.txt with the
+	time series) into a new SpatiaLite database readable by the
+	spatialite provider. The indexes on the PS code and the spatial index
+	are built once all the rows are in.
+	progress(rows, rowsPerSecond) is called after each chunk.
+	"""
+	psTable = psTable or tableName(psPath)
+	tsTable = tsTable or "ts_%s" % psTable
+	stats = ImportStats()
+	started = time.time()
+	dates = set()
+
+	def report(table, rows, dateValues):
+		stats.rows += rows
+		if table == psTable:
+			stats.points += rows
+		if dateValues is not None:
+			dates.update( np.unique(dateValues).tolist() )
+		stats.seconds = time.time() - started
+		if progress:
+			progress( stats.rows, stats.rowsPerSecond )
+
+	tmpPath = "%s.%d.tmp" % (dbPath, os.getpid())
+	if os.path.exists(tmpPath):
+		os.remove(tmpPath)
+
+	conn = connectSpatialite(tmpPath)
+	try:
+		for pragma in BULK_PRAGMAS:
+			conn.execute( pragma )
+		conn.execute( "SELECT InitSpatialMetadata(1)" )
+
+		psNames = _loadTable( conn, psPath, psTable, ('code',), geometryField, chunkSize, report )
+		# dates stay yyyyMMdd strings, as expected by the time series readers
+		tsNames = _loadTable( conn, tsPath, tsTable, ('code', 'dataripresa'), None, chunkSize, report )
+
+		# build the indexes on the loaded data
+		if 'code' in psNames:
+			conn.execute( "CREATE INDEX %s ON %s (code)" % (_quote("idx_%s_code" % psTable), _quote(psTable)) )
+		if 'code' in tsNames:
+			# (code, pass) serves the lookups by code as well
+			indexed = "code, cod_passaggio" if 'cod_passaggio' in tsNames else "code"
+			conn.execute( "CREATE INDEX %s ON %s (%s)" % (_quote("idx_%s_code" % tsTable), _quote(tsTable), indexed) )
+		if geometryField in psNames:
+			conn.execute( "SELECT CreateSpatialIndex(?, ?)", (psTable, geometryField) )
+		if psNames or tsNames:
+			conn.execute( "ANALYZE" )
+		conn.commit()
+
+		for pragma in DEFAULT_PRAGMAS:
+			conn.execute( pragma )
+	except Exception:
+		conn.close()
+		os.remove(tmpPath)
+		raise
+	conn.close()
+	os.replace( tmpPath, dbPath )
+
+	stats.dates = len(dates)
+	stats.seconds = time.time() - started
+	return stats
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.PyQt.QtWidgets import QDialog, QFormLayout, QVBoxLayout, QGroupBox, QCheckBox, QComboBox, QSpinBox, QDialogButtonBox
+
+from qgis.core import QgsSettings
+
+from .ts_lru import DEFAULT_BUDGET_MB
+
+
+class PerformanceSettings_Dlg(QDialog):
+	""" edit the /pstimeseries settings tuning how the time series are read and cached """
+
+	def __init__(self, parent=None):
+		QDialog.__init__(self, parent)
+		self.setWindowTitle( "PS Time Series Viewer - Performance settings" )
+
+		# shapefile PS layers
+		self.cubeModeCheck = QCheckBox( "Load the displacements of the shapefiles into memory" )
+		self.cubeCacheCheck = QCheckBox( "Keep them in a cache file, reopened on the next sessions" )
+		self.cubeTiledCheck = QCheckBox( "Split the cache in spatial tiles, loaded as the map is panned" )
+		self.maxResidentSpin = QSpinBox()
+		self.maxResidentSpin.setRange( 1, 100000 )
+		self.storageCombo = QComboBox()
+		self.storageCombo.addItem( "float32", "float32" )
+		self.storageCombo.addItem( "int16 (fixed point)", "int16" )
+		self.storageCombo.addItem( "int32 (fixed point)", "int32" )
+		self.deltaCheck = QCheckBox( "Store the differences between consecutive dates" )
+
+		cubeBox = QGroupBox( "Shapefile layers" )
+		form = QFormLayout( cubeBox )
+		form.addRow( self.cubeModeCheck )
+		form.addRow( self.cubeCacheCheck )
+		form.addRow( self.cubeTiledCheck )
+		form.addRow( "Tiles kept in memory", self.maxResidentSpin )
+		form.addRow( "Cached values", self.storageCombo )
+		form.addRow( self.deltaCheck )
+
+		# time series tables
+		self.seriesCacheSpin = QSpinBox()
+		self.seriesCacheSpin.setRange( 0, 64 * 1024 )
+		self.seriesCacheSpin.setSuffix( " MB" )
+		self.dateWindowCheck = QCheckBox( "Fetch only the dates shown by the chart" )
+
+		tableBox = QGroupBox( "Time series tables" )
+		form = QFormLayout( tableBox )
+		form.addRow( "Series kept in memory", self.seriesCacheSpin )
+		form.addRow( self.dateWindowCheck )
+
+		buttons = QDialogButtonBox( QDialogButtonBox.Ok | QDialogButtonBox.Cancel )
+		buttons.accepted.connect( self.accept )
+		buttons.rejected.connect( self.reject )
+
+		layout = QVBoxLayout( self )
+		layout.addWidget( cubeBox )
+		layout.addWidget( tableBox )
+		layout.addWidget( buttons )
+
+		self.cubeModeCheck.toggled.connect( self.updateEnabled )
+		self.cubeCacheCheck.toggled.connect( self.updateEnabled )
+		self.cubeTiledCheck.toggled.connect( self.updateEnabled )
+		self.initProps()
+
+	def updateEnabled(self):
+		cube = self.cubeModeCheck.isChecked()
+		cache = cube and self.cubeCacheCheck.isChecked()
+		self.cubeCacheCheck.setEnabled( cube )
+		self.cubeTiledCheck.setEnabled( cache )
+		self.maxResidentSpin.setEnabled( cache and self.cubeTiledCheck.isChecked() )
+		self.storageCombo.setEnabled( cache )
+		self.deltaCheck.setEnabled( cache )
+
+	def initProps(self):
+		settings = QgsSettings()
+		self.cubeModeCheck.setChecked( settings.value( "/pstimeseries/cubeMode", True, type=bool ) )
+		self.cubeCacheCheck.setChecked( settings.value( "/pstimeseries/cubeCache", True, type=bool ) )
+		self.cubeTiledCheck.setChecked( settings.value( "/pstimeseries/cubeTiled", False, type=bool ) )
+		self.maxResidentSpin.setValue( settings.value( "/pstimeseries/maxResidentTiles", 64, type=int ) )
+		index = self.storageCombo.findData( settings.value( "/pstimeseries/cacheStorage", "float32" ) )
+		self.storageCombo.setCurrentIndex( max(index, 0) )
+		self.deltaCheck.setChecked( settings.value( "/pstimeseries/cacheDelta", False, type=bool ) )
+		self.seriesCacheSpin.setValue( settings.value( "/pstimeseries/seriesCacheMB", DEFAULT_BUDGET_MB, type=int ) )
+		self.dateWindowCheck.setChecked( settings.value( "/pstimeseries/dateWindow", False, type=bool ) )
+		self.updateEnabled()
+
+	def accept(self):
+		settings = QgsSettings()
+		settings.setValue( "/pstimeseries/cubeMode", self.cubeModeCheck.isChecked() )
+		settings.setValue( "/pstimeseries/cubeCache", self.cubeCacheCheck.isChecked() )
+		settings.setValue( "/pstimeseries/cubeTiled", self.cubeTiledCheck.isChecked() )
+		settings.setValue( "/pstimeseries/maxResidentTiles", self.maxResidentSpin.value() )
+		settings.setValue( "/pstimeseries/cacheStorage", self.storageCombo.currentData() )
+		settings.setValue( "/pstimeseries/cacheDelta", self.deltaCheck.isChecked() )
+		settings.setValue( "/pstimeseries/seriesCacheMB", self.seriesCacheSpin.value() )
+		settings.setValue( "/pstimeseries/dateWindow", self.dateWindowCheck.isChecked() )
+
+		QDialog.accept(self)
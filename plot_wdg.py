@@ -26,6 +26,7 @@ from qgis.PyQt.QtGui import QCursor
 # Matplotlib Figure object
 from matplotlib.figure import Figure
 
+import numpy as np
 from datetime import datetime, date
 from matplotlib.dates import date2num, num2date, YearLocator, MonthLocator, DayLocator, DateFormatter
 from matplotlib.lines import Line2D
@@ -33,6 +34,13 @@ from matplotlib.lines import Line2D
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 
 
+def isDateSeries(values):
+	""" return whether the values are dates, either a datetime64 array or a list of date objects """
+	if isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+		return True
+	return isinstance(values[0], (datetime, date)) if values is not None and len(values) > 0 else False
+
+
 class PlotPS():
 	"""Class that define a PS Time"""
 	def __init__(self, x, y=None):
@@ -82,7 +90,7 @@ class PlotWdg(FigureCanvasQTAgg):
 	def itemAt(self, index,icollections):     #for each PlotPS object
 		if index >= len(self.collections[icollections].x):
 			return None
-		return (self.collections[icollections].x[index] if self.collections[icollections].x else None, self.collections[icollections].y[index] if self.collections[icollections].y else None)
+		return (self.collections[icollections].x[index] if len(self.collections[icollections].x) else None, self.collections[icollections].y[index] if len(self.collections[icollections].y) else None)
 
 	def delete(self):
 		self._clear()
@@ -145,12 +153,12 @@ class PlotWdg(FigureCanvasQTAgg):
 	def getLimits(self):   #xlim et ylim globalisées
 		idx=-1
 		self.xlim = self.axes.get_xlim()
-		is_x_date = isinstance((self.x0)[0], (datetime, date)) if len(self.x0) > 0 else False
+		is_x_date = isDateSeries(self.x0)
 		if is_x_date:
 
 			self.xlim = num2date(self.xlim)
 		self.ylim = self.axes.get_ylim()
-		is_y_date = isinstance(self.y0[0], (datetime, date)) if self.y0 is not None and len(self.y0) > 0 else False
+		is_y_date = isDateSeries(self.y0)
 		if is_y_date:
 			self.ylim = num2date(self.ylim)
 
@@ -197,8 +205,8 @@ class PlotWdg(FigureCanvasQTAgg):
 			self.collections[idx].items=items
 
 	def _callPlotFunc(self, plotfunc, x, y=None, *args, **kwargs):
-		is_x_date = isinstance(x[0], (datetime, date)) if len(x) > 0 else False
-		is_y_date = isinstance(y[0], (datetime, date)) if y is not None and len(y) > 0 else False
+		is_x_date = isDateSeries(x)
+		is_y_date = isDateSeries(y)
 
 		if is_x_date:
 			self._setAxisDateFormatter( self.axes.xaxis, x )
@@ -221,14 +229,16 @@ class PlotWdg(FigureCanvasQTAgg):
 
 	@classmethod
 	def _setAxisDateFormatter(self, axis, data):
-		timedelta = max(data) - min(data)
-		if timedelta.days > 365*5:
+		# datetime64 arrays are converted at once, date lists element-wise
+		days = np.asarray(data, dtype='datetime64[D]')
+		span = int( (days.max() - days.min()).astype(np.int64) )
+		if span > 365*5:
 			axis.set_major_formatter( DateFormatter('%Y') )
 			#axis.set_major_locator( YearLocator() )
 			#axis.set_minor_locator( MonthLocator() )
 			#bins = timedelta.days * 4 / 356	# four bins for a year
 
-		elif timedelta.days > 30*5:
+		elif span > 30*5:
 			axis.set_major_formatter( DateFormatter('%Y-%m') )
 			#axis.set_major_locator( MonthLocator() )
 			#axis.set_minor_locator( DayLocator() )
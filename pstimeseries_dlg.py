@@ -218,11 +218,11 @@ class PlotGraph(PlotWdg):
 		for idx in range(len(self.collections)):
 			if self._showDetrendedValues:
 				self._origY[idx] = self.collections[idx].y
-				self.collections[idx].y += -np.array( self._getTrendLineData(idx)[1] )
+				self.collections[idx].y = np.asarray( self.collections[idx].y ) - self._getTrendLineData(idx)[1]
 	
 			elif self._origY[idx] is not None:
 				self.collections[idx].y = self._origY[idx]
-				self._origY = None
+				self._origY[idx] = None
 	
 			# remove and re-draw points
 			self._removeItem( self._points[idx],idx )     
@@ -410,24 +410,17 @@ class MainPSWindow(QMainWindow):
 		for i in range(self.ui.list_series.count()):
 			list_item.append( self.ui.list_series.item(i) )
 		selected = self.get_diff( list_item )
+		if len(selected[0]) != 2:
+			return
         
-        #Transformer les datetime
-		yeari = []
-		monthi = []
-		dayi = []
-		for j in range(len(selected[0])):
-			for i in range(len(selected[0][0])) : 
-				yeari.append(selected[0][j][i].year)
-				monthi.append(selected[0][j][i].month)
-				dayi.append(selected[0][j][i].day)
-            
-		if yeari[0:int(len(yeari)/2)] == yeari[int(len(yeari)/2):]:
-			xdiff = selected[0][0]
-			ydiff = []
-			for i in range(len(selected[1][0])):
-				ydiff.append(float(selected[1][0][i]) - float(selected[1][1][i]))
+		# the series are datetime64 arrays, compared at once
+		xs = [ np.asarray( x, dtype='datetime64[D]' ) for x in selected[0] ]
+		if np.array_equal( xs[0], xs[1] ):
+			xdiff = xs[0]
+			ydiff = np.asarray( selected[1][0], dtype=np.float64 ) - np.asarray( selected[1][1], dtype=np.float64 )
 		else:
-			QMessageBox.warning( self.iface.mainWindow(),"PS Time Series Viewer","No match in time." % self.ts_tablename )
+			QMessageBox.warning( self.iface.mainWindow(),"PS Time Series Viewer","No match in time." )
+			return
         
 		self.nb_series=0
 		layer = self.iface.activeLayer()
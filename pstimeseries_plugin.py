@@ -21,17 +21,26 @@ email               : brush.tyler@gmail.com
  ***************************************************************************/
 """
 
-from qgis.PyQt.QtCore import Qt, QRegExp, QDate, QFileInfo, QDir, pyqtSignal
+import os
+import time
+import numpy as np
+
+from qgis.PyQt.QtCore import Qt, QVariant, QFileInfo, QDir, pyqtSignal
 from qgis.PyQt.QtGui import QIcon, QCursor
-from qgis.PyQt.QtWidgets import QAction, QInputDialog, QMessageBox, QApplication,QMainWindow
+from qgis.PyQt.QtWidgets import QAction, QInputDialog, QMessageBox, QApplication,QMainWindow, QFileDialog
 
-from qgis.core import QgsMapLayer, QgsWkbTypes, QgsFeature, QgsFeatureRenderer, QgsFeatureRequest, QgsMessageLog, QgsDataSourceUri, QgsVectorLayer
+from qgis.core import Qgis, QgsMapLayer, QgsWkbTypes, QgsFeature, QgsField, QgsFeatureRenderer, QgsFeatureRequest, QgsMessageLog, QgsDataSourceUri, QgsVectorLayer, QgsVectorLayerFeatureSource, QgsSettings, QgsProject, QgsApplication
 
 from . import resources_rc
 
 from .pstimeseries_dlg import MainPSWindow
 
 
+# key fields and (date, value) fields of the time series tables of the
+# Oracle Spatial and VRT PS layers
+OGR_TS_KEYS = ("id_dataset", "code_target")
+OGR_TS_FIELDS = ("data_misura", "spost_rel_mm")
+
 
 class PSTimeSeries_Plugin:
 
@@ -46,6 +55,23 @@ class PSTimeSeries_Plugin:
         
         self.window=None
         self.first_point=True
+
+        # displacement cubes of the shapefile PS layers, by layer id
+        self.cubes = {}
+        self.watchedLayers = set()
+        # text time-series tables read through their byte-offset index, by path
+        self.textIndexes = {}
+        # time series tables kept open, by (uri, provider)
+        self.tsSources = {}
+        self.pgPool = None
+        # time series tables whose indexes have been checked
+        self.indexChecked = set()
+        # task finding the PS of the last click and fetching its series
+        self.clickTask = None
+        # time series tables found in each connection, by connection
+        self.tsCatalogs = {}
+        # time series table of each PS layer, by layer id
+        self.tsTables = {}
     
     def close_Event(self, e):
         """Capture la fermeture de la fenêtre"""
@@ -67,23 +93,304 @@ class PSTimeSeries_Plugin:
         self.aboutAction = QAction( QIcon( ":/pstimeseries_plugin/icons/about" ), "About", self.iface.mainWindow() )
         self.aboutAction.triggered.connect( self.about )
 
+        self.loadDumpsAction = QAction( "Load PS text dumps into SpatiaLite...", self.iface.mainWindow() )
+        self.loadDumpsAction.triggered.connect( self.loadTextDumps )
+
+        self.plotSelectedAction = QAction( "Plot the selected PS", self.iface.mainWindow() )
+        self.plotSelectedAction.triggered.connect( self.plotSelected )
+
+        self.packAction = QAction( "Pack the time series table", self.iface.mainWindow() )
+        self.packAction.triggered.connect( self.packTStable )
+
+        self.statsAction = QAction( "Compute the velocities in the database", self.iface.mainWindow() )
+        self.statsAction.triggered.connect( self.computeStatistics )
+
+        self.snapshotAction = QAction( "Snapshot the time series table", self.iface.mainWindow() )
+        self.snapshotAction.triggered.connect( self.snapshotTStable )
+
+        self.perfSettingsAction = QAction( "Performance settings...", self.iface.mainWindow() )
+        self.perfSettingsAction.triggered.connect( self.performanceSettings )
+
         # add actions to toolbars and menus
         self.iface.addToolBarIcon( self.action )
         self.iface.addPluginToMenu( "&Permanent Scatterers", self.action )
+        self.iface.addPluginToMenu( "&Permanent Scatterers", self.plotSelectedAction )
+        self.iface.addPluginToMenu( "&Permanent Scatterers", self.loadDumpsAction )
+        self.iface.addPluginToMenu( "&Permanent Scatterers", self.packAction )
+        self.iface.addPluginToMenu( "&Permanent Scatterers", self.statsAction )
+        self.iface.addPluginToMenu( "&Permanent Scatterers", self.snapshotAction )
+        self.iface.addPluginToMenu( "&Permanent Scatterers", self.perfSettingsAction )
         #self.iface.addPluginToMenu( "&Permanent Scatterers", self.aboutAction )
 
+        # keep the tiles of the tiled cubes in sync with the canvas
+        self.iface.mapCanvas().extentsChanged.connect( self._updateResidentTiles )
+
     def unload(self):
         # remove actions from toolbars and menus
         self.iface.removeToolBarIcon( self.action )
         self.iface.removePluginMenu( "&Permanent Scatterers", self.action )
+        self.iface.removePluginMenu( "&Permanent Scatterers", self.plotSelectedAction )
+        self.iface.removePluginMenu( "&Permanent Scatterers", self.loadDumpsAction )
+        self.iface.removePluginMenu( "&Permanent Scatterers", self.packAction )
+        self.iface.removePluginMenu( "&Permanent Scatterers", self.statsAction )
+        self.iface.removePluginMenu( "&Permanent Scatterers", self.snapshotAction )
+        self.iface.removePluginMenu( "&Permanent Scatterers", self.perfSettingsAction )
         #self.iface.removePluginMenu( "&Permanent Scatterers", self.aboutAction )
 
+        self.iface.mapCanvas().extentsChanged.disconnect( self._updateResidentTiles )
+        self.cubes = {}
+        self._cancelClickTask()
+        self._closeTSsources()
+        if self.pgPool is not None:
+            self.pgPool.close()
+            self.pgPool = None
+
     def about(self):
         """ display the about dialog """
         from .about_dlg import AboutDlg
         dlg = AboutDlg( self.iface.mainWindow() )
         dlg.exec_()
 
+    def performanceSettings(self):
+        """ display the dialog of the settings tuning how the time series are read and cached """
+        from .perf_settings_dialog import PerformanceSettings_Dlg
+        dlg = PerformanceSettings_Dlg( self.iface.mainWindow() )
+        if dlg.exec_():
+            # the cubes are loaded again with the new settings
+            self.cubes = {}
+            from .ts_lru import sharedCache
+            sharedCache()
+        dlg.deleteLater()
+
+    def plotSelected(self):
+        """ plot the time series of the selected PS, fetched in a single query """
+        ps_layer = self.iface.activeLayer()
+        if not ps_layer or ps_layer.type() != QgsMapLayer.VectorLayer or ps_layer.geometryType() != QgsWkbTypes.PointGeometry \
+                or ps_layer.selectedFeatureCount() == 0:
+            QMessageBox.information(self.iface.mainWindow(), "PS Time Series Viewer", "Select some points of a vector layer and try again.")
+            return
+
+        request = QgsFeatureRequest()
+        request.setFlags( QgsFeatureRequest.NoGeometry )
+        feats = [ (f.id(), f.attributes()) for f in ps_layer.getSelectedFeatures( request ) ]
+        ps_fields = ps_layer.dataProvider().fields()
+
+        series = []
+        if self._isTSsourceLayer( ps_layer ):
+            source = self._getPSsource( ps_layer )
+            if source is None:
+                return
+            keys = [ self._featureKey( ps_fields, attrs, source.keyFields ) for fid, attrs in feats ]
+            QApplication.setOverrideCursor( QCursor( Qt.WaitCursor ) )
+            try:
+                fetched = source.fetchManyByPass( [key for key in keys if key is not None], self._dateWindow() )
+            finally:
+                QApplication.restoreOverrideCursor()
+
+            # a series for each acquisition pass of a PS, as for a click
+            infoFields = dict(enumerate(ps_fields))
+            for (fid, attrs), key in zip(feats, keys):
+                if key is not None:
+                    passes = fetched[ key ]
+                    for passage, (dates, values) in passes.items():
+                        series.append( (fid, dates, values, infoFields, passage if len(passes) > 1 else None) )
+
+        elif ps_layer.source().lower().split("|")[0].endswith( ".shp" ):
+            for fid, attrs in feats:
+                x, y, infoFields = self._getShapefileXYvalues( ps_layer, fid, attrs )
+                series.append( (fid, x, y, infoFields, None) )
+
+        if not self.running:
+            self.run()
+        for fid, x, y, infoFields, passage in series:
+            if len(x) > 0:
+                self._addSeries( ps_layer, fid, x, y, infoFields, passage )
+
+    def packTStable(self):
+        """ create or refresh the packed companion of the time series table of a PostGIS or SpatiaLite layer """
+        ps_layer = self.iface.activeLayer()
+        if not ps_layer or ps_layer.type() != QgsMapLayer.VectorLayer or ps_layer.providerType() not in ['postgres', 'spatialite']:
+            QMessageBox.information(self.iface.mainWindow(), "PS Time Series Viewer", "Select a PostGIS or SpatiaLite layer and try again.")
+            return
+        if ps_layer.providerType() == 'postgres' and not self._hasPsycopg():
+            QMessageBox.warning(self.iface.mainWindow(), "PS Time Series Viewer", "The psycopg2 module is needed to pack the table.")
+            return
+
+        dsuri = QgsDataSourceUri( ps_layer.source() )
+        if not self._askTStablename( ps_layer, "ts_%s" % dsuri.table() ):
+            return
+
+        from .ts_packing import packTable, packSqliteTable, packedName
+        dropTable = False
+        if ps_layer.providerType() == 'spatialite':
+            dropTable = QMessageBox.question( self.iface.mainWindow(),
+                    "PS Time Series Viewer",
+                    "Drop the table %s once packed?\nThe database gets smaller, but the packed table can't be rebuilt "
+                    "and the time series can be read by this plugin only." % self.ts_tablename,
+                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No ) == QMessageBox.Yes
+        # the sources opened so far read the long table
+        self._closeTSsources()
+
+        QApplication.setOverrideCursor( QCursor( Qt.WaitCursor ) )
+        try:
+            if ps_layer.providerType() == 'spatialite':
+                # BLOBs of int32 days and float32 values, rebuilt every time
+                packSqliteTable( dsuri.database(), self.ts_tablename, ("code",), "dataripresa", "valore", dropTable=dropTable )
+                created = True
+                # the catalog lists the packed table once the long one is dropped
+                self.tsCatalogs.pop( ('spatialite', dsuri.database()), None )
+            else:
+                # materialized view with date[] and real[] arrays
+                from .ts_sources import ConnectionPool
+                if self.pgPool is None:
+                    self.pgPool = ConnectionPool()
+                connInfo = dsuri.connectionInfo( True )
+                conn, prepared = self.pgPool.acquire( connInfo )
+                try:
+                    created = packTable( conn, dsuri.schema(), self.ts_tablename, ("code",), "dataripresa", "valore" )
+                except Exception:
+                    self.pgPool.release( connInfo, conn, prepared, broken=True )
+                    raise
+                self.pgPool.release( connInfo, conn, prepared )
+        except Exception as e:
+            QMessageBox.warning( self.iface.mainWindow(), "PS Time Series Viewer", "Unable to pack the table: %s" % e )
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        QgsMessageLog.logMessage( "%s the packed table %s%s" % ("Created" if created else "Refreshed", packedName( self.ts_tablename ),
+                ", dropped %s" % self.ts_tablename if dropTable else ""), "PSTimeSeriesViewer" )
+
+    def snapshotTStable(self):
+        """ copy the time series table of an Oracle Spatial or VRT layer to a local indexed snapshot, or append its new rows """
+        ps_layer = self.iface.activeLayer()
+        if not ps_layer or ps_layer.type() != QgsMapLayer.VectorLayer or ps_layer.providerType() != 'ogr' or not self._isTSsourceLayer( ps_layer ):
+            QMessageBox.information(self.iface.mainWindow(), "PS Time Series Viewer", "Select an Oracle Spatial or VRT layer and try again.")
+            return
+
+        uri = self._ogrTSuri( ps_layer )
+        if uri is None:
+            return
+
+        from .ts_snapshot import takeSnapshot, snapshotPath, snapshotInfo
+        # the sources opened so far may read the snapshot being written
+        self._closeTSsources()
+        QApplication.setOverrideCursor( QCursor( Qt.WaitCursor ) )
+        try:
+            started = time.time()
+            copied = takeSnapshot( uri, 'ogr', OGR_TS_KEYS, OGR_TS_FIELDS[0], OGR_TS_FIELDS[1] )
+        except Exception as e:
+            QMessageBox.warning( self.iface.mainWindow(), "PS Time Series Viewer", "Unable to snapshot the table: %s" % e )
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        info = snapshotInfo( snapshotPath( uri ) )
+        QgsMessageLog.logMessage( "Copied %d rows of %s to its snapshot in %.1f s, %s rows up to %s" % (copied, self.ts_tablename,
+                time.time() - started, info.get("rows"), info.get("last_date")), "PSTimeSeriesViewer" )
+
+    def computeStatistics(self):
+        """ compute the trend and statistics of every PS of a PostGIS or SpatiaLite layer in the database, into a memory layer """
+        ps_layer = self.iface.activeLayer()
+        if not ps_layer or ps_layer.type() != QgsMapLayer.VectorLayer or ps_layer.providerType() not in ['postgres', 'spatialite']:
+            QMessageBox.information(self.iface.mainWindow(), "PS Time Series Viewer", "Select a PostGIS or SpatiaLite layer and try again.")
+            return
+
+        source = self._getPSsource( ps_layer )
+        if source is None:
+            return
+        if not hasattr( source, "statistics" ):
+            QMessageBox.warning(self.iface.mainWindow(), "PS Time Series Viewer", "The statistics can't be computed in the database of this time series table.")
+            return
+
+        from .ts_sources import STATS_FIELDS, PASS_FIELD
+        QApplication.setOverrideCursor( QCursor( Qt.WaitCursor ) )
+        try:
+            started = time.time()
+            stats = source.statistics( self._dateWindow() )
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            QMessageBox.warning( self.iface.mainWindow(), "PS Time Series Viewer", "Unable to compute the statistics: %s" % e )
+            return
+        QgsMessageLog.logMessage( "Computed the statistics of %d PS (%d series) of %s in %.1f s" % (len(stats), sum( map(len, stats.values()) ),
+                self.ts_tablename, time.time() - started), "PSTimeSeriesViewer" )
+
+        try:
+            # the slope is by day, the velocity by year
+            layer = QgsVectorLayer( "Point?crs=%s" % ps_layer.crs().authid(), "%s velocities" % ps_layer.name(), "memory" )
+            # a feature for each acquisition pass of a PS
+            hasPasses = PASS_FIELD in source.fields
+            fields = [ QgsField( fld, QVariant.String ) for fld in source.keyFields + ((PASS_FIELD,) if hasPasses else ()) ]
+            fields += [ QgsField( fld, QVariant.Int if fld == "count" else QVariant.Double ) for fld in STATS_FIELDS ]
+            fields.append( QgsField( "velocity", QVariant.Double ) )
+            layer.dataProvider().addAttributes( fields )
+            layer.updateFields()
+
+            ps_fields = ps_layer.dataProvider().fields()
+            feats = []
+            for f in ps_layer.getFeatures():
+                key = self._featureKey( ps_fields, f.attributes(), source.keyFields )
+                if key not in stats:
+                    continue
+                for passage, values in stats[ key ].items():
+                    slope = values[0]
+                    feat = QgsFeature( layer.fields() )
+                    feat.setGeometry( f.geometry() )
+                    passes = [ str(passage) if passage is not None else None ] if hasPasses else []
+                    feat.setAttributes( [ str(value) for value in key ] + passes + list( values ) + [ slope * 365.25 if slope is not None else None ] )
+                    feats.append( feat )
+            layer.dataProvider().addFeatures( feats )
+        finally:
+            QApplication.restoreOverrideCursor()
+        QgsProject.instance().addMapLayer( layer )
+
+    def loadTextDumps(self):
+        """ load a all_*.txt / ts_all_*.txt delivery into a SpatiaLite database """
+        psPath, _ = QFileDialog.getOpenFileName( self.iface.mainWindow(), "Select the PS dump", "", "Text (*.txt *.csv *.tsv)" )
+        if not psPath:
+            return
+
+        # the time series are expected next to the PS, as ts_<name>
+        tsPath = os.path.join( os.path.dirname( psPath ), "ts_" + os.path.basename( psPath ) )
+        if not os.path.isfile( tsPath ):
+            tsPath, _ = QFileDialog.getOpenFileName( self.iface.mainWindow(), "Select the time series dump", os.path.dirname( psPath ), "Text (*.txt *.csv *.tsv)" )
+            if not tsPath:
+                return
+
+        dbPath, _ = QFileDialog.getSaveFileName( self.iface.mainWindow(), "Save the SpatiaLite database",
+                os.path.splitext( psPath )[0] + ".sqlite", "SpatiaLite (*.sqlite *.db)" )
+        if not dbPath:
+            return
+
+        import sqlite3
+        from .db_loader import loadDumps, tableName
+        statusBar = self.iface.mainWindow().statusBar()
+        def progress(rows, rowsPerSecond):
+            statusBar.showMessage( "Loading PS dumps: %d rows (%.0f rows/s)" % (rows, rowsPerSecond) )
+            QApplication.processEvents()
+
+        QApplication.setOverrideCursor( QCursor( Qt.WaitCursor ) )
+        try:
+            stats = loadDumps( dbPath, psPath, tsPath, progress=progress )
+        except (RuntimeError, ValueError, EnvironmentError, sqlite3.Error) as e:
+            QMessageBox.warning( self.iface.mainWindow(), "PS Time Series Viewer", "Unable to load the dumps: %s" % e )
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+            statusBar.clearMessage()
+        QgsMessageLog.logMessage( "Loaded %s into %s: %s" % (psPath, dbPath, stats), "PSTimeSeriesViewer" )
+
+        # add the PS layer, its time series table is known
+        psTable = tableName( psPath )
+        dsuri = QgsDataSourceUri()
+        dsuri.setDatabase( dbPath )
+        dsuri.setDataSource( "", psTable, "the_geom" )
+        layer = QgsVectorLayer( dsuri.uri(), psTable, "spatialite" )
+        if layer.isValid():
+            QgsProject.instance().addMapLayer( layer )
+            self.ts_tablename = "ts_%s" % psTable
+            self.last_ps_layerid = layer.id()
+
     def detect(self):
         #detects a click on the qgis interface
         self.window.close.connect(self.reinit)
@@ -122,18 +429,75 @@ class PSTimeSeries_Plugin:
             self.detect()
 
     def _onPointClicked(self, ps_layer, point):
-        # get the id of the point feature under the mouse click
+        # find the point feature under the mouse click and fetch its time
+        # series in a background task, the series still being fetched for
+        # a previous click are dropped
         from .MapTools import FeatureFinder
-        fid = FeatureFinder.findAtPoint(ps_layer, point, canvas=self.iface.mapCanvas(), onlyTheClosestOne=True, onlyIds=True)
+        from .ts_tasks import ClickTask
+        self._cancelClickTask()
+
+        points = None
+        source = tsSource = keyIdxs = None
+        if ps_layer.source().lower().split("|")[0].endswith( ".shp" ):
+            # search among the coordinates held by the cube, if any
+            cube = self._getCube( ps_layer )
+            if cube is not None and not ps_layer.subsetString():
+                points = cube.points()
+
+        elif self._isTSsourceLayer( ps_layer ):    # Oracle Spatial, PostGIS or SpatiaLite
+            # the time series are in a separate table, joined by key fields
+            source = self._getPSsource( ps_layer )
+            if source is None:
+                return
+
+            names = [ fld.name().lower() for fld in ps_layer.dataProvider().fields() ]
+            if not all( fld in names for fld in source.keyFields ):
+                QgsMessageLog.logMessage( "%s not found. Exiting" % ", ".join( source.keyFields ), "PSTimeSeriesViewer" )
+                return
+            keyIdxs = [ names.index( fld ) for fld in source.keyFields ]
+            tsSource = source.threadSafe()
+
+        # the layer is read by the task through a thread-safe feature source
+        from .ts_lru import sharedCache
+        rect, center = FeatureFinder.searchArea( ps_layer, point, self.iface.mapCanvas() )
+        # the layer may be removed while the task runs, it's looked up again by id
+        layerId = ps_layer.id()
+        done = lambda task, result: self._onClickFetched( layerId, source, task, result )
+        window = self._dateWindow()
+        # the series already fetched in the session are read from the cache
+        cacheScope = ( ps_layer.source(), self.ts_tablename, window )
+        self.clickTask = ClickTask( QgsVectorLayerFeatureSource( ps_layer ), rect, center, done,
+                points, tsSource, keyIdxs, window, sharedCache(), cacheScope )
+        QgsApplication.taskManager().addTask( self.clickTask )
+
+    def _cancelClickTask(self):
+        # utility function used to cancel the task of the previous click
+        if self.clickTask is not None:
+            try:
+                self.clickTask.cancel()
+            except RuntimeError:
+                pass    # already deleted by the task manager
+            self.clickTask = None
+
+    def _onClickFetched(self, layerId, source, task, result):
+        # display the time series fetched by the task of a click, in the
+        # GUI thread
+        if task is not self.clickTask:
+            return
+        self.clickTask = None
+        ps_layer = QgsProject.instance().mapLayer( layerId )
+        if ps_layer is None:
+            return
+        if not result:
+            if task.error is not None:
+                QgsMessageLog.logMessage( "Unable to fetch the time series: %s" % task.error, "PSTimeSeriesViewer", Qgis.Warning )
+            return
+        fid, attrs = task.fid, task.attrs
         if fid is None:
             return
-        # get the attribute map of the selected feature
-        feat = QgsFeature()
-        feats = ps_layer.getFeatures( QgsFeatureRequest(fid) )
-        feats.nextFeature(feat)
-        attrs = feat.attributes()
 
-        x, y = [], []    # lists containg x,y values
+        x, y = [], []    # dates and values, datetime64 and float arrays once read
+        passes = {}    # pass -> (x, y) of the PS acquired by several passes
         infoFields = {}    # hold the index->name of the fields containing info to be displayed
 
         ps_source = ps_layer.source()
@@ -147,117 +511,29 @@ class PSTimeSeries_Plugin:
         if ps_source.lower().endswith( ".shp" ): #providerType == 'ogr' and
             # Shapefile
             QgsMessageLog.logMessage( "Type is .shp" )
-            
-            for idx, fld in enumerate(ps_fields) :
-                if QRegExp( "D\\d{8}", Qt.CaseInsensitive ).indexIn( fld.name() ) < 0 :
-                    # info fields are all except those containing dates
-                    infoFields[ idx ] = fld
-                else :
-                    x.append( QDate.fromString( fld.name()[1:], "yyyyMMdd" ).toPyDate() )
-                    y.append( float(attrs[ idx ]) )
-
-        elif providerType == 'ogr' and (ps_source.upper().startswith("OCI:") or ps_source.lower().endswith(".vrt")):    # Oracle Spatial
-            # fields containing values
-            dateField = "data_misura"
-            valueField = "spost_rel_mm"
-            infoFields = dict(enumerate(ps_fields))
-
-            # search for the id_dataset and code_target fields needed to join
-            # PS and TS tables
-            idDataset = codeTarget = None
-            for idx, fld in enumerate(ps_fields):
-                if fld.name().lower() == "id_dataset":
-                    idDataset = attrs[ idx ]
-                if fld.name().lower() == "code_target":
-                    codeTarget = attrs[ idx ]
-
-            if idDataset is None or codeTarget is None:
-                QgsMessageLog.logMessage( "idDataset is %s, codeTarget is %s. Exiting" % (idDataset, codeTarget), "PSTimeSeriesViewer" )
-                return
-            subset = "id_dataset='%s' AND code_target='%s'" % (idDataset, codeTarget)
-
-            # create the uri
-            if ps_source.upper().startswith( "OCI:" ):
-                default_tbl_name = "RISKNAT.RNAT_TARGET_SSTO"
-            elif ps_source.lower().endswith(".vrt"):
-                default_tbl_name = "rnat_target_sso.vrt"
-            else:
-                default_tbl_name = ""
-            if not self._askTStablename( ps_layer,  default_tbl_name ):
-                return
-
-            if ps_source.upper().startswith( "OCI:" ):
-                # uri is like OCI:userid/password@database:table
-                pos = uri.indexOf(':', 4)
-                if pos >= 0:
-                    uri = uri[0:pos]
-                uri = "%s:%s" % (uri, self.ts_tablename)
-            else:
-                # it's a VRT file
-                uri = "%s/%s" % (QFileInfo(ps_source).path(), self.ts_tablename)
-                uri = QDir.toNativeSeparators( uri )
-
-            # load the layer containing time series
-            ts_layer = self._createTSlayer( uri, providerType, subset )
-            if ts_layer is None:
-                return
+            x, y, infoFields = self._getShapefileXYvalues( ps_layer, fid, attrs )
 
-            # get time series X and Y values
-            try:
-                x, y = self._getXYvalues( ts_layer, dateField, valueField )
-            finally:
-                ts_layer.deleteLater()
-                del ts_layer
-
-        elif providerType in ['postgres', 'spatialite']:# either PostGIS or SpatiaLite
-            # fields containing values
-            dateField = "dataripresa"
-            valueField = "valore"
+        elif source is not None:    # Oracle Spatial, PostGIS or SpatiaLite
             infoFields = dict(enumerate(ps_fields))
+            subset = " AND ".join( "%s='%s'" % item for item in zip(source.keyFields, task.key) )
 
-            # search for the id_dataset and code_target fields needed to join
-            # PS and TS tables
-            code = None
-            for idx, fld in enumerate( ps_fields ):
-                if fld.name().lower() == "code":
-                    code = attrs[ idx ]
-
-            if code is None:
-                QgsMessageLog.logMessage( "code is None. Exiting" % code, "PSTimeSeriesViewer" )
-                return
-            subset = "code='%s'" % code
-
-            # create the uri
-            dsuri = QgsDataSourceUri( ps_layer.source() )
-            default_tbl_name = "ts_%s" % dsuri.table()
-            if not self._askTStablename( ps_layer,  default_tbl_name ):
-                return
-            dsuri.setDataSource( dsuri.schema(), self.ts_tablename, None ) # None or "" ? check during tests
-            dsuri.setWkbType(QgsWkbTypes.Unknown)
-            dsuri.setSrid(None)
-            uri = dsuri.uri()
-
-            # load the layer containing time series
-            ts_layer = self._createTSlayer( uri, providerType, subset )
-            if ts_layer is None:
-                return
+            # time series X and Y values, a series for each acquisition
+            # pass, split by the query
+            if task.cached:
+                stats = task.cache.stats()
+                QgsMessageLog.logMessage( "Time series of %s read from the cache (%d hits, %d misses, %d KB)" % (", ".join( map(str, task.key) ),
+                        stats['hits'], stats['misses'], stats['bytes'] / 1024), "PSTimeSeriesViewer" )
+            elif source not in self.indexChecked:
+                self._checkTSindexes( source, task.seconds )
+            passes = task.passes
+            if passes:
+                x = np.concatenate( [ dates for dates, values in passes.values() ] )
+                y = np.concatenate( [ values for dates, values in passes.values() ] )
 
-            # get time series X and Y values
-            try:
-                x, y = self._getXYvalues( ts_layer, dateField, valueField )
-            finally:
-                ts_layer.deleteLater()
-                del ts_layer
         elif ps_source.lower().split("|")[0].endswith( ".shp" ): #providerType == 'ogr' and
             # Shapefile
             QgsMessageLog.logMessage( ".shp well opened" )
-            for idx, fld in enumerate(ps_fields):
-                if QRegExp( "D\\d{8}", Qt.CaseInsensitive ).indexIn( fld.name() ) < 0:
-                    # info fields are all except those containing dates
-                    infoFields[ idx ] = fld
-                else:
-                    x.append( QDate.fromString( fld.name()[1:], "yyyyMMdd" ).toPyDate() )
-                    y.append( float(attrs[ idx ]) )
+            x, y, infoFields = self._getShapefileXYvalues( ps_layer, fid, attrs )
         else:
             QgsMessageLog.logMessage( "Type is invalid" )
             
@@ -269,6 +545,15 @@ class PSTimeSeries_Plugin:
             QgsMessageLog.logMessage( "provider: %s - uri: %s\nsubset: %s" % (providerType, uri, subset), "PSTimeSeriesViewer" )
             return
 
+        if len(passes) <= 1:
+            self._addSeries( ps_layer, fid, x, y, infoFields )
+        else:
+            for passage, (x, y) in passes.items():
+                self._addSeries( ps_layer, fid, x, y, infoFields, passage )
+
+#------------------------------------------------------------------------------------------
+
+    def _addSeries(self, ps_layer, fid, x, y, infoFields, passage=None):
         # display the plot dialog
         from .pstimeseries_dlg import PSTimeSeries_Dlg
         
@@ -298,75 +583,529 @@ class PSTimeSeries_Plugin:
             pass
             
         finally:
-            self.window.ui.list_series.addItem(ps_layer.sourceName()+";   Point "+str(fid))
+            label = ps_layer.sourceName()+";   Point "+str(fid)
+            if passage is not None:
+                label += ";   Pass "+str(passage)
+            self.window.ui.list_series.addItem(label)
             return     #"(self.dlg)
 
-#------------------------------------------------------------------------------------------
+    def _dateWindow(self):
+        # utility function used to get the dates shown by the chart, the
+        # series are fetched only within them if the dateWindow setting is on
+        if not QgsSettings().value( "/pstimeseries/dateWindow", False, type=bool ):
+            return None
+        if self.nb_series == 0 or self.window is None or not hasattr( self.window, "dlg" ):
+            return None
+        toolbar = self.window.dlg.toolbar
+        return ( np.datetime64( toolbar.minDateEdit.date().toPyDate(), 'D' ),
+                np.datetime64( toolbar.maxDateEdit.date().toPyDate(), 'D' ) )
 
-    def _getXYvalues(self, ts_layer, dateField, valueField):
-        # utility function used to get the X and Y values
-        x, y = [], []
+    def _getShapefileXYvalues(self, ps_layer, fid, attrs):
+        # utility function used to get the X and Y values stored in the
+        # D######## fields of the PS layer, as datetime64 and float arrays
+        cube = self._getCube( ps_layer )
+        if cube is not None:
+            series = cube.series( fid )
+            if series is not None:
+                from .ts_sources import windowSlice
+                dates, values = windowSlice( *series, window=self._dateWindow() )
+                return dates, values, cube.infoFields
 
-        # get indexes of date (x) and value (y) fields
-        dateIdx, valueIdx = None, None
-        for idx, fld in enumerate(ts_layer.dataProvider().fields()):
-            if fld.name().lower() == dateField:
-                dateIdx = idx
-            elif fld.name().lower() == valueField:
-                valueIdx = idx
+        from .ts_dates import dateFieldIndexes
+        fields = ps_layer.dataProvider().fields()
+        indexes, dates = dateFieldIndexes( [ fld.name() for fld in fields ] )
+        # info fields are all except those containing dates
+        dateIdxs = set( indexes )
+        infoFields = dict( (idx, fld) for idx, fld in enumerate(fields) if idx not in dateIdxs )
+        values = np.array( [ np.nan if attrs[ idx ] == None else attrs[ idx ] for idx in indexes ], dtype=np.float64 )
+        return dates, values, infoFields
 
-        if dateIdx is None or valueIdx is None:
-            QgsMessageLog.logMessage("field %s -> index %s, field %s -> index %s. Exiting" % (dateField, dateIdx, valueField, valueIdx), "PSTimeSeriesViewer")
-            return
+    def _getCube(self, ps_layer):
+        # utility function used to get the displacement cube of the layer,
+        # it's loaded on first use unless the cube mode is disabled
+        if not QgsSettings().value( "/pstimeseries/cubeMode", True, type=bool ):
+            return None
 
-        # fetch and loop through all the features
-        request = QgsFeatureRequest()
-        request.setSubsetOfAttributes([dateIdx, valueIdx])
-        for f in ts_layer.getFeatures( request ):
-            # get x and y values
-            a = f.attributes()
-            x.append( QDate.fromString( a[ dateIdx ], "yyyyMMdd" ).toPyDate() )
-            y.append( float(a[ valueIdx ]) )
+        cube = self.cubes.get( ps_layer.id() )
+        if cube is None:
+            from .ts_cube import TSCube
+            from .ts_dates import dateFieldIndexes
+            QApplication.setOverrideCursor( QCursor( Qt.WaitCursor ) )
+            try:
+                path = ps_layer.source().split("|")[0]
+                if path.lower().endswith( ".shp" ):
+                    cube = self._loadShapefileCube( path )
+
+                if cube is not None:
+                    fields = ps_layer.dataProvider().fields()
+                    dateIdxs = set( dateFieldIndexes( [fld.name() for fld in fields] )[0] )
+                    cube.infoFields = dict( (idx, fld) for idx, fld in enumerate(fields) if idx not in dateIdxs )
+                else:
+                    cube = TSCube.fromLayer( ps_layer )
+            finally:
+                QApplication.restoreOverrideCursor()
+            QgsMessageLog.logMessage( "Loaded %d x %d cube for layer %s" % (len(cube), len(cube.dates), ps_layer.name()), "PSTimeSeriesViewer" )
+
+            if ps_layer.id() not in self.watchedLayers:
+                # drop the cube as soon as it gets outdated
+                self.watchedLayers.add( ps_layer.id() )
+                ps_layer.dataChanged.connect( lambda lid=ps_layer.id(): self.cubes.pop( lid, None ) )
+                ps_layer.willBeDeleted.connect( lambda lid=ps_layer.id(): self.cubes.pop( lid, None ) )
+            self.cubes[ ps_layer.id() ] = cube
+            self._updateResidentTiles()
+
+        return cube
+
+    def _loadShapefileCube(self, path):
+        # utility function used to load the cube of a shapefile, reading the
+        # .dbf/.shp records directly or reopening the persistent cache
+        from .ts_cube import TSCube
+        from .ts_cache import TSCacheFile, cacheKey, fileStamp, cachePath, purgeOutdated
+        from .ts_tiles import TiledTSCube, buildTiles, tilesPath, tilesExist
+        from .shapefile_io import DbfReader, ShpPointReader, sidecarPath
+
+        settings = QgsSettings()
+        useCache = settings.value( "/pstimeseries/cubeCache", True, type=bool )
+        # nationwide datasets are stored in spatial tiles loaded on demand
+        tiled = useCache and settings.value( "/pstimeseries/cubeTiled", False, type=bool )
+        maxResident = settings.value( "/pstimeseries/maxResidentTiles", 64, type=int )
+        # values can be stored as float32 or as fixed point int16/int32
+        storage = {
+            'storage': settings.value( "/pstimeseries/cacheStorage", "float32" ),
+            'delta': settings.value( "/pstimeseries/cacheDelta", False, type=bool ),
+        }
+        if storage['storage'] not in ('float32', 'int16', 'int32'):
+            storage['storage'] = 'float32'
+
+        dbfPath = sidecarPath( path, ".dbf" )
+        if dbfPath is None:
+            return None
+
+        if useCache:
+            try:
+                stamp = "%s|%s|%s" % (fileStamp(path), fileStamp(dbfPath), sorted(storage.items()))
+                key = cacheKey( path, stamp )
+                if tiled:
+                    if tilesExist( tilesPath(key) ):
+                        return TiledTSCube( tilesPath(key), maxResident )
+                else:
+                    cache = TSCacheFile.forKey( key )
+                    if cache is not None:
+                        return cache.toCube()
+            except (IOError, OSError, ValueError):
+                useCache = tiled = False
+
+        try:
+            reader = DbfReader.forShapefile( path )
+        except (IOError, OSError, ValueError) as e:
+            QgsMessageLog.logMessage( "Unable to map the .dbf file: %s" % e, "PSTimeSeriesViewer" )
+            return None
+        if reader is None:
+            return None
+        try:
+            shpReader = ShpPointReader( path )
+        except (IOError, OSError, ValueError) as e:
+            QgsMessageLog.logMessage( "Unable to map the .shp file: %s" % e, "PSTimeSeriesViewer" )
+            shpReader = tiled = None
+
+        codes = None
+        for name in reader.fieldNames():
+            if name.lower() == "code":
+                codes = reader.column( name )
+
+        # the fixed point scale follows the decimals of the date fields
+        if reader.dateIdxs:
+            storage['scale'] = 10.0 ** -reader.fields[ reader.dateIdxs[0] ][4]
+
+        if tiled and len(shpReader) != len(reader):
+            QgsMessageLog.logMessage( "The .shp and .dbf files of %s have %d and %d records, the cube isn't tiled" % (path, len(shpReader), len(reader)),
+                    "PSTimeSeriesViewer" )
+            tiled = False
+        if tiled:
+            # write the tiles reading few records at a time
+            x, y = shpReader.points()
+            # deleted records can't be found on the map
+            deleted = reader.deleted()
+            x[ deleted ] = np.nan
+            y[ deleted ] = np.nan
+            try:
+                buildTiles( tilesPath(key), reader.dates, reader.series, np.arange(len(reader)), x, y, codes, key=key, **storage )
+                purgeOutdated( key )
+                return TiledTSCube( tilesPath(key), maxResident )
+            except (IOError, OSError, ValueError) as e:
+                QgsMessageLog.logMessage( "Unable to write the time series tiles: %s" % e, "PSTimeSeriesViewer" )
+
+        # read the .dbf records directly, skipping the provider
+        cube = TSCube.fromDbf( reader, shpReader )
+
+        if useCache:
+            try:
+                cache = TSCacheFile.write( cachePath(key), cube.dates, cube.values, codes, cube.fids, cube.x, cube.y, key=key, **storage )
+                purgeOutdated( key )
+            except (IOError, OSError, ValueError) as e:
+                QgsMessageLog.logMessage( "Unable to write the time series cache: %s" % e, "PSTimeSeriesViewer" )
+            else:
+                cube = cache.toCube()
+
+        return cube
+
+    def _updateResidentTiles(self):
+        # load the tiles of the tiled cubes intersecting the map canvas
+        # extent, the ones not on screen get evicted
+        from .ts_tiles import TiledTSCube
+        canvas = self.iface.mapCanvas()
+        for lid, cube in list(self.cubes.items()):
+            layer = QgsProject.instance().mapLayer( lid )
+            if layer is None or not isinstance(cube, TiledTSCube):
+                continue
+            rect = canvas.mapSettings().mapToLayerCoordinates( layer, canvas.extent() )
+            cube.setExtent( rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum() )
+
+    def _textTSfile(self, ps_layer, tblname):
+        # utility function used to check whether the time-series table is
+        # a tab-delimited text file, either by absolute path or next to the
+        # database of the PS layer
+        if not tblname or os.path.splitext( tblname )[1].lower() not in (".txt", ".csv", ".tsv"):
+            return None
+        if os.path.isabs( tblname ):
+            return tblname if os.path.isfile( tblname ) else None
+
+        database = QgsDataSourceUri( ps_layer.source() ).database()
+        if database:
+            path = os.path.join( os.path.dirname( database ), tblname )
+            if os.path.isfile( path ):
+                return path
+        return None
+
+    def _getTextTSsource(self, path):
+        # utility function used to get the source of the time series of a
+        # text file, the index is built once and kept as a sidecar file.
+        # In cube mode the file is imported into the cache instead
+        source = self.textIndexes.get( path )
+        if source is None:
+            from .text_dumps import TextIndex
+            from .ts_sources import TextTSSource
+            QApplication.setOverrideCursor( QCursor( Qt.WaitCursor ) )
+            try:
+                if QgsSettings().value( "/pstimeseries/cubeMode", True, type=bool ):
+                    source = self._importTextCube( path )
+                if source is None:
+                    source = TextTSSource( TextIndex.open( path ) )
+            finally:
+                QApplication.restoreOverrideCursor()
+            self.textIndexes[ path ] = source
+        return source
+
+    def _importTextCube(self, path):
+        # utility function used to import a long-format text table into the
+        # persistent cache, once for each state of the file. The PS get the
+        # coordinates of the attribute dump next to it, if any. None if it
+        # can't be imported
+        from .text_dumps import importLongFormat, psDumpPath, PSDump
+        from .ts_cache import TSCacheFile, cacheKey, fileStamp, cachePath, purgeOutdated
+        from .ts_sources import CubeTSSource
+        try:
+            dumpPath = psDumpPath( path )
+            stamp = fileStamp( path ) if dumpPath is None else "%s|%s" % (fileStamp( path ), fileStamp( dumpPath ))
+            key = cacheKey( path, stamp )
+            cache = TSCacheFile.forKey( key )
+            if cache is None:
+                points = PSDump.fromFile( dumpPath ) if dumpPath is not None else None
+                stats = importLongFormat( path, cachePath( key ), key=key, points=points )
+                purgeOutdated( key )
+                QgsMessageLog.logMessage( "Imported %s into the time series cache: %s" % (path, stats), "PSTimeSeriesViewer" )
+                cache = TSCacheFile.forKey( key )
+        except (IOError, OSError, ValueError) as e:
+            QgsMessageLog.logMessage( "Unable to import %s into the time series cache: %s" % (path, e), "PSTimeSeriesViewer" )
+            return None
+
+        source = CubeTSSource( cache )
+        return source if source.isValid() else None
+
+    def _isTSsourceLayer(self, ps_layer):
+        # utility function used to check whether the time series of a PS
+        # layer are stored in a separate table
+        providerType = ps_layer.providerType()
+        ps_source = ps_layer.source()
+        if providerType == 'ogr':
+            return ps_source.upper().startswith("OCI:") or ps_source.lower().endswith(".vrt")
+        return providerType in ['postgres', 'spatialite']
+
+    def _getPSsource(self, ps_layer):
+        # utility function used to get the source of the time series table
+        # of a PS layer, the PS are identified in it by source.keyFields
+        providerType = ps_layer.providerType()
+        ps_source = ps_layer.source()
 
-        return x, y
+        if providerType == 'ogr':    # Oracle Spatial
+            # fields containing values
+            dateField, valueField = OGR_TS_FIELDS
+            # the id_dataset and code_target fields join PS and TS tables
+            keyFields = OGR_TS_KEYS
+
+            uri = self._ogrTSuri( ps_layer )
+            if uri is None:
+                return
+
+            from .ts_snapshot import snapshotPath, SNAPSHOT_TABLE
+            snapshot = snapshotPath( uri )
+            if os.path.isfile( snapshot ):
+                # read the indexed local copy of the table, see snapshotTStable
+                dsuri = QgsDataSourceUri()
+                dsuri.setDatabase( snapshot )
+                dsuri.setDataSource( "", SNAPSHOT_TABLE, None )
+                uri, providerType = dsuri.uri(), 'spatialite'
+
+        else:    # either PostGIS or SpatiaLite
+            # fields containing values
+            dateField = "dataripresa"
+            valueField = "valore"
+            # the code field joins PS and TS tables
+            keyFields = ("code",)
+
+            # create the uri
+            dsuri = QgsDataSourceUri( ps_source )
+            default_tbl_name = "ts_%s" % dsuri.table()
+            if not self._askTStablename( ps_layer,  default_tbl_name ):
+                return
+
+            textPath = self._textTSfile( ps_layer, self.ts_tablename )
+            if textPath is not None:
+                # time series in a plain text table, read only the lines
+                # of the PS through the byte-offset index
+                return self._getTextTSsource( textPath )
+
+            dsuri.setDataSource( dsuri.schema(), self.ts_tablename, None ) # None or "" ? check during tests
+            dsuri.setWkbType(QgsWkbTypes.Unknown)
+            dsuri.setSrid(None)
+            uri = dsuri.uri()
+
+        return self._getTSsource( uri, providerType, keyFields, dateField, valueField )
+
+    def _ogrTSuri(self, ps_layer):
+        # utility function used to get the uri of the time series table of
+        # an Oracle Spatial or VRT PS layer
+        ps_source = ps_layer.source()
+        if ps_source.upper().startswith( "OCI:" ):
+            default_tbl_name = "RISKNAT.RNAT_TARGET_SSTO"
+        else:
+            default_tbl_name = "rnat_target_sso.vrt"
+        if not self._askTStablename( ps_layer,  default_tbl_name ):
+            return None
+
+        if ps_source.upper().startswith( "OCI:" ):
+            # uri is like OCI:userid/password@database:table
+            uri = ps_source
+            pos = uri.find(':', 4)
+            if pos >= 0:
+                uri = uri[0:pos]
+            return "%s:%s" % (uri, self.ts_tablename)
+
+        # it's a VRT file
+        uri = "%s/%s" % (QFileInfo(ps_source).path(), self.ts_tablename)
+        return QDir.toNativeSeparators( uri )
+
+    def _featureKey(self, ps_fields, attrs, keyFields):
+        # utility function used to get the values of the key fields of a PS
+        names = [ fld.name().lower() for fld in ps_fields ]
+        if not all( fld in names for fld in keyFields ):
+            return None
+        return tuple( attrs[ names.index( fld ) ] for fld in keyFields )
 
 #---------------------------------------------------------------------------------------------
 
     def _askTStablename(self, ps_layer, default_tblname=None):
-        # utility function used to ask to the user the name of the table
-        # containing time series data
+        # utility function used to get the name of the table containing
+        # time series data. The table is chosen among the ones found in the
+        # connection of the layer, the user is asked only if there are
+        # several or none
         if default_tblname is None:
             default_tblname = ""
 
-        # ask a tablename to the user
-        if ps_layer.id() != self.last_ps_layerid or not self.ts_tablename:
-            tblname, ok = QInputDialog.getText( self.iface.mainWindow(),
-                    "PS Time Series Viewer",
-                    "Insert the name of the table containing time-series",
-                    text=default_tblname )
-            if not ok:
-                return False
+        if ps_layer.id() == self.last_ps_layerid and self.ts_tablename:
+            return True
 
-            self.ts_tablename = tblname
-            self.last_ps_layerid = ps_layer.id()
+        tblname = self.tsTables.get( ps_layer.id() )
+        if tblname is None:
+            candidates = self._tsCandidates( ps_layer )
+            names = [ name.lower() for name in candidates ]
+            if default_tblname.lower() in names:
+                tblname = candidates[ names.index( default_tblname.lower() ) ]
+            elif len(candidates) == 1:
+                tblname = candidates[0]
+            else:
+                if candidates:
+                    tblname, ok = QInputDialog.getItem( self.iface.mainWindow(),
+                            "PS Time Series Viewer",
+                            "Select the table containing time-series",
+                            candidates, 0, True )
+                else:
+                    tblname, ok = QInputDialog.getText( self.iface.mainWindow(),
+                            "PS Time Series Viewer",
+                            "Insert the name of the table containing time-series",
+                            text=default_tblname )
+                if not ok:
+                    return False
+
+                # don't build a layer on a table known not to hold time series
+                if candidates and tblname.lower() not in names and self._textTSfile( ps_layer, tblname ) is None:
+                    QMessageBox.warning( self.iface.mainWindow(),
+                            "PS Time Series Viewer",
+                            "The table '%s' doesn't contain time series." % tblname )
+                    return False
+            self.tsTables[ ps_layer.id() ] = tblname
 
+        self.ts_tablename = tblname
+        self.last_ps_layerid = ps_layer.id()
         return True
 
+    def _tsCandidates(self, ps_layer):
+        # utility function used to get the names of the tables holding time
+        # series in the connection of a PS layer, the catalog is scanned
+        # once per connection
+        from . import ts_catalog
+        providerType = ps_layer.providerType()
+        ps_source = ps_layer.source()
+        dsuri = QgsDataSourceUri( ps_source )
+        schema = None
+
+        if providerType == 'ogr' and ps_source.upper().startswith( "OCI:" ):
+            pos = ps_source.find(':', 4)
+            connection = ps_source[0:pos] if pos >= 0 else ps_source
+            discover = lambda: ts_catalog.oracleTables( ps_source )
+        elif providerType == 'ogr':
+            connection = QFileInfo( ps_source ).path()
+            discover = lambda: ts_catalog.vrtTables( connection )
+        elif providerType == 'postgres':
+            if not self._hasPsycopg():
+                return []
+            from .ts_sources import ConnectionPool
+            if self.pgPool is None:
+                self.pgPool = ConnectionPool()
+            connection = dsuri.connectionInfo( True )
+            schema = dsuri.schema() or 'public'
+            discover = lambda: ts_catalog.postgresTables( self.pgPool, connection )
+        elif providerType == 'spatialite':
+            connection = dsuri.database()
+            discover = lambda: ts_catalog.sqliteTables( connection )
+        else:
+            return []
+
+        catalog = self.tsCatalogs.get( (providerType, connection) )
+        if catalog is None:
+            try:
+                catalog = discover()
+            except Exception as e:
+                QgsMessageLog.logMessage( "Unable to look for the time series tables of %s: %s" % (ps_layer.name(), e), "PSTimeSeriesViewer" )
+                catalog = {}
+            self.tsCatalogs[ (providerType, connection) ] = catalog
+            QgsMessageLog.logMessage( "Found %d time series tables in the connection of %s" % (len(catalog), ps_layer.name()), "PSTimeSeriesViewer" )
+
+        if schema is not None:
+            # the time series table is looked for in the schema of the PS table
+            return sorted( table for sch, table in catalog if sch == schema )
+        return sorted( catalog )
+
 #--------------------------------------------------------------------------------------------
 
-    def _createTSlayer(self, uri, providerType, subset=None):
-        # utility function used to create the vector layer containing time
-        # series data
-        layer = QgsVectorLayer( uri, "time_series_layer", providerType )
-        if not layer.isValid():
+    def _getTSsource(self, uri, providerType, keyFields, dateField, valueField):
+        # utility function used to get the source of the time series data,
+        # the table is opened once per (uri, provider) for the whole session
+        source = self.tsSources.get( (uri, providerType) )
+        if source is not None:
+            return source
+
+        from .ts_sources import LayerTSSource, SqliteTSSource, PostgresTSSource, ConnectionPool
+        source = None
+        if providerType == 'postgres' and self._hasPsycopg():
+            # pooled connections with the series query prepared on the server
+            if self.pgPool is None:
+                self.pgPool = ConnectionPool()
+            dsuri = QgsDataSourceUri( uri )
+            # an authcfg is expanded into the credentials psycopg2 needs
+            source = PostgresTSSource( self.pgPool, dsuri.connectionInfo( True ), dsuri.schema(), dsuri.table(), keyFields, dateField, valueField )
+            if not source.isValid():
+                source.close()
+                source = None
+
+        elif providerType == 'spatialite':
+            # the table is read with sqlite3, without the provider overhead
+            dsuri = QgsDataSourceUri( uri )
+            source = SqliteTSSource( dsuri.database(), dsuri.table(), keyFields, dateField, valueField )
+            if not source.isValid():
+                source.close()
+                source = None
+
+        if source is None:
+            source = LayerTSSource( uri, providerType, keyFields, dateField, valueField )
+        if not source.isValid():
             QMessageBox.warning( self.iface.mainWindow(),
                     "PS Time Series Viewer",
                     "The layer '%s' wasn't found." % self.ts_tablename )
+            self.tsTables.pop( self.last_ps_layerid, None )
             self.ts_tablename = None
             return
 
-        if subset is not None:
-            layer.setSubsetString( subset )
+        self.tsSources[ (uri, providerType) ] = source
+        return source
 
-        return layer
-    
\ No newline at end of file
+    def _checkTSindexes(self, source, seconds):
+        # utility function used to check, when a time series table is first
+        # used, that its lookups are served by an index and to offer to
+        # create the missing one. The finding is logged with the time taken
+        # by the first lookup
+        from .ts_sources import coversKeys, indexColumns
+        self.indexChecked.add( source )
+        name = getattr( source, "table", None ) or getattr( source, "uri", self.ts_tablename )
+        keys = ", ".join( source.keyFields )
+        try:
+            indexes = source.indexes()
+        except Exception as e:
+            QgsMessageLog.logMessage( "Unable to read the indexes of %s: %s" % (name, e), "PSTimeSeriesViewer" )
+            return
+
+        if indexes is None:
+            QgsMessageLog.logMessage( "Index check of %s: no index available on (%s), lookup took %d ms" % (name, keys, seconds * 1000), "PSTimeSeriesViewer" )
+            return
+        if coversKeys( indexes, source.keyFields ):
+            QgsMessageLog.logMessage( "Index check of %s: (%s) indexed, lookup took %d ms" % (name, keys, seconds * 1000), "PSTimeSeriesViewer" )
+            return
+        QgsMessageLog.logMessage( "Index check of %s: (%s) NOT indexed, lookup took %d ms" % (name, keys, seconds * 1000), "PSTimeSeriesViewer", Qgis.Warning )
+
+        columns = ", ".join( indexColumns( source.keyFields, source.fields ) )
+        if QMessageBox.question( self.iface.mainWindow(),
+                "PS Time Series Viewer",
+                "The time series table %s has no index on (%s), a lookup took %d ms.\nCreate an index on (%s) now?" % (name, keys, seconds * 1000, columns),
+                QMessageBox.Yes | QMessageBox.No ) != QMessageBox.Yes:
+            return
+
+        QApplication.setOverrideCursor( QCursor( Qt.WaitCursor ) )
+        try:
+            started = time.time()
+            source.createIndex()
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            QMessageBox.warning( self.iface.mainWindow(), "PS Time Series Viewer", "Unable to create the index: %s" % e )
+            return
+        QApplication.restoreOverrideCursor()
+        QgsMessageLog.logMessage( "Created the index on (%s) of %s in %.1f s" % (columns, name, time.time() - started), "PSTimeSeriesViewer" )
+
+    def _closeTSsources(self):
+        # utility function used to close the time series tables kept open,
+        # the text ones included with their memory-mapped files
+        for source in list(self.tsSources.values()) + list(self.textIndexes.values()):
+            source.close()
+        self.tsSources = {}
+        self.textIndexes = {}
+        self.indexChecked = set()
+        # the tables may have been changed meanwhile
+        from .ts_lru import sharedCache
+        sharedCache().clear()
+
+    def _hasPsycopg(self):
+        # utility function used to check whether psycopg2 is available
+        try:
+            import psycopg2
+        except ImportError:
+            return False
+        return True
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import numpy as np
+
+from .ts_dates import dateFieldIndexes
+
+
+def _parseFloats(raw, dtype=np.float32):
+	""" parse an array of fixed width ASCII numbers, blanks become NaN """
+	try:
+		return raw.astype(dtype)
+	except ValueError:
+		pass
+
+	# blank or overflowed ('****') values
+	raw = np.char.strip(raw)
+	invalid = (raw == b'') | np.char.startswith(raw, b'*')
+	raw = np.where(invalid, b'nan', raw)
+	return raw.astype(dtype)
+
+
+def sidecarPath(shpPath, ext):
+	""" return the path of the file with extension ext next to a .shp one, whatever its case, or None """
+	base = os.path.splitext(shpPath)[0]
+	for path in (base + ext.lower(), base + ext.upper()):
+		if os.path.isfile(path):
+			return path
+
+	# mixed case, e.g. .Dbf
+	dirname, name = os.path.split(base)
+	wanted = (name + ext).lower()
+	try:
+		for entry in os.listdir(dirname or os.curdir):
+			if entry.lower() == wanted:
+				return os.path.join(dirname, entry)
+	except OSError:
+		pass
+	return None
+
+
+class DbfReader:
+	""" memory-mapped reader for the fixed width records of a .dbf file """
+
+	def __init__(self, path):
+		self.path = path
+		self._map = np.memmap(path, dtype=np.uint8, mode='r')
+
+		header = self._map[:32]
+		count = int( header[4:8].view('<u4')[0] )
+		self.headerLength = int( header[8:10].view('<u2')[0] )
+		self.recordLength = int( header[10:12].view('<u2')[0] )
+
+		# the file may be truncated (or end with the 0x1A marker)
+		available = (len(self._map) - self.headerLength) // self.recordLength
+		self.recordCount = min(count, available)
+
+		# field descriptors, the first record byte is the deletion flag
+		self.fields = []
+		offset = 1
+		pos = 32
+		while pos + 32 <= self.headerLength and self._map[pos] != 0x0D:
+			desc = self._map[pos:pos+32].tobytes()
+			name = desc[:11].split(b'\0')[0].decode('latin-1')
+			ftype = chr(desc[11])
+			width, decimals = desc[16], desc[17]
+			self.fields.append( (name, ftype, offset, width, decimals) )
+			offset += width
+			pos += 32
+
+		dtype = np.dtype({
+			'names': ['_deleted'] + [f[0] for f in self.fields],
+			'formats': ['S1'] + ['S%d' % f[3] for f in self.fields],
+			'offsets': [0] + [f[2] for f in self.fields],
+			'itemsize': self.recordLength,
+		})
+		self.records = np.ndarray( (self.recordCount,), dtype=dtype, buffer=self._map, offset=self.headerLength )
+
+		self.dateIdxs, self.dates = dateFieldIndexes( [f[0] for f in self.fields] )
+		self._dateBlock = self._contiguousBlock( self.dateIdxs )
+
+	def _contiguousBlock(self, idxs):
+		# when the fields share the same width and follow each other, view
+		# them as a 2D array of fixed width strings
+		if not idxs:
+			return None
+		width = self.fields[ idxs[0] ][3]
+		for i, idx in enumerate(idxs):
+			if idx != idxs[0] + i or self.fields[idx][3] != width:
+				return None
+
+		return np.ndarray( (self.recordCount, len(idxs)), dtype='S%d' % width,
+				buffer=self._map, offset=self.headerLength + self.fields[ idxs[0] ][2],
+				strides=(self.recordLength, width) )
+
+	def __len__(self):
+		return self.recordCount
+
+	def fieldNames(self):
+		return [f[0] for f in self.fields]
+
+	def column(self, name):
+		""" return the raw bytes of a field for all the records """
+		return self.records[ name ]
+
+	def deleted(self):
+		""" return the mask of the records marked as deleted """
+		return self.records[ '_deleted' ] == b'*'
+
+	def series(self, rows=None):
+		""" return the (n_rows x n_dates) float32 values of the requested records """
+		rows = slice(None) if rows is None else np.asarray(rows, dtype=np.int64)
+
+		if self._dateBlock is not None:
+			return _parseFloats( self._dateBlock[ rows ] )
+
+		values = np.empty( (len(self.records[rows]), len(self.dateIdxs)), dtype=np.float32 )
+		for col, idx in enumerate(self.dateIdxs):
+			values[:, col] = _parseFloats( self.records[ self.fields[idx][0] ][ rows ] )
+		return values
+
+	def close(self):
+		self.records = self._dateBlock = None
+		self._map = None
+
+	@staticmethod
+	def forShapefile(shpPath):
+		""" return the reader of the .dbf file next to a .shp one or None """
+		path = sidecarPath(shpPath, '.dbf')
+		return DbfReader(path) if path is not None else None
+
+
+class ShpPointReader:
+	""" memory-mapped reader for the coordinates of a point .shp file """
+
+	POINT, POINTZ, POINTM = 1, 11, 21
+	# record size (8 bytes header + content) for each point shape type
+	RECORD_SIZES = { POINT: 28, POINTM: 36, POINTZ: 44 }
+
+	def __init__(self, path):
+		self.path = path
+		self._map = np.memmap(path, dtype=np.uint8, mode='r')
+
+		if int( self._map[0:4].view('>i4')[0] ) != 9994:
+			raise ValueError( "%s is not a shapefile" % path )
+		self.shapeType = int( self._map[32:36].view('<i4')[0] )
+		if self.shapeType not in self.RECORD_SIZES:
+			raise ValueError( "%s doesn't contain points (shape type %d)" % (path, self.shapeType) )
+		self.bbox = tuple( self._map[36:68].view('<f8') )
+
+		# record offsets from the index file, if any
+		self._offsets = None
+		shxPath = sidecarPath(path, '.shx')
+		if shxPath is not None:
+			shx = np.memmap(shxPath, dtype=np.uint8, mode='r')
+			self._offsets = shx[100:].view('>i4').reshape(-1, 2)[:, 0].astype(np.int64) * 2
+
+		recSize = self.RECORD_SIZES[ self.shapeType ]
+		body = len(self._map) - 100
+		if self._offsets is not None:
+			self.recordCount = len(self._offsets)
+			self._fixed = body == self.recordCount * recSize
+		else:
+			self.recordCount = body // recSize
+			self._fixed = body % recSize == 0
+			if not self._fixed:
+				raise ValueError( "%s has variable size records but no .shx index" % path )
+
+	def __len__(self):
+		return self.recordCount
+
+	def points(self):
+		""" return the x, y contiguous float64 arrays in record order, null shapes are NaN """
+		if self._fixed:
+			# all the records have the same size, view them as a structured array
+			dtype = np.dtype({
+				'names': ['type', 'x', 'y'],
+				'formats': ['<i4', '<f8', '<f8'],
+				'offsets': [8, 12, 20],
+				'itemsize': self.RECORD_SIZES[ self.shapeType ],
+			})
+			records = np.ndarray( (self.recordCount,), dtype=dtype, buffer=self._map, offset=100 )
+			return np.ascontiguousarray( records['x'] ), np.ascontiguousarray( records['y'] )
+
+		# null shapes are shorter, gather the bytes at the offsets of the index
+		offsets = self._offsets[:, None]
+		last = len(self._map) - 1
+		gather = lambda start, size: self._map[ np.minimum(offsets + start + np.arange(size), last) ]
+		types = gather(8, 4).view('<i4')[:, 0]
+		x = gather(12, 8).view('<f8')[:, 0].copy()
+		y = gather(20, 8).view('<f8')[:, 0].copy()
+		x[ types == 0 ] = np.nan
+		y[ types == 0 ] = np.nan
+		return x, y
+
+	def close(self):
+		self._map = self._offsets = None
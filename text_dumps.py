@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import io
+import os
+import time
+import numpy as np
+
+from .ts_dates import ymdToDatetime64
+from .ts_cache import TSCacheFile, HAS_COORDS, HAS_PASSES
+
+
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# longest PS code handled while parsing, codes are shrunk afterwards
+MAX_CODE_WIDTH = 64
+
+
+def readHeader(path, delimiter='\t'):
+	""" return the lowercase column names and the length in bytes of the header line """
+	with open(path, 'rb') as f:
+		line = f.readline()
+	names = line.decode('utf-8').strip().split(delimiter)
+	return [name.strip().lower() for name in names], len(line)
+
+
+def iterChunks(path, chunkSize=CHUNK_SIZE, start=0):
+	""" yield (offset, block) of about chunkSize bytes, each block ending with a complete line """
+	with open(path, 'rb') as f:
+		f.seek(start)
+		offset = start
+		rest = b''
+		while True:
+			data = f.read(chunkSize)
+			if not data:
+				break
+			data = rest + data
+			end = data.rfind(b'\n') + 1
+			if end == 0:
+				rest = data
+				continue
+			yield offset, data[:end]
+			offset += end
+			rest = data[end:]
+
+		if rest.strip():
+			yield offset, rest + b'\n'
+
+
+def parseTableChunk(block, delimiter='\t'):
+	""" parse a block of lines into a (n_rows x n_columns) array of bytes """
+	return np.loadtxt( io.BytesIO(block), dtype=np.bytes_, delimiter=delimiter, ndmin=2, comments=None )
+
+
+class TSColumns:
+	""" indexes of the columns of a long-format time series dump """
+
+	def __init__(self, names, codeField="code", dateField="dataripresa", valueField="valore", passField="cod_passaggio"):
+		missing = [f for f in (codeField, dateField, valueField) if f not in names]
+		if missing:
+			raise ValueError( "missing columns: %s" % ", ".join(missing) )
+		self.code = names.index(codeField)
+		self.date = names.index(dateField)
+		self.value = names.index(valueField)
+		self.passage = names.index(passField) if passField in names else None
+
+	def dtype(self):
+		fields = [(self.code, 'code', 'S%d' % MAX_CODE_WIDTH), (self.date, 'date', '<i4'), (self.value, 'value', '<f4')]
+		if self.passage is not None:
+			fields.append( (self.passage, 'passage', '<i4') )
+		fields.sort()
+		return [f[0] for f in fields], np.dtype([f[1:] for f in fields])
+
+
+def parseTSChunk(block, columns, delimiter='\t'):
+	""" parse the lines of a block at once, dates are yyyyMMdd integers """
+	usecols, dtype = columns.dtype()
+	return np.loadtxt( io.BytesIO(block), dtype=dtype, delimiter=delimiter, usecols=usecols, ndmin=1, comments=None )
+
+
+class ImportStats:
+	def __init__(self):
+		self.rows = 0
+		self.points = 0
+		self.dates = 0
+		self.seconds = 0.0
+
+	@property
+	def rowsPerSecond(self):
+		return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+	def __str__(self):
+		return "%d rows (%d PS x %d dates) in %.1f s, %.0f rows/s" % (self.rows, self.points, self.dates, self.seconds, self.rowsPerSecond)
+
+
+def importLongFormat(path, cachePath, chunkSize=CHUNK_SIZE, progress=None, key="", points=None, **fields):
+	"""
+	Import a long-format dump (one row per PS and date) into a cache file
+	reading it in chunks, so memory is bounded by the chunk size plus the
+	code and date vectors whatever the file size. The first pass collects
+	the codes, passes and dates, the second one writes the values in place.
+	A PS acquired by several passes gets a row for each pass.
+	progress(rows, rowsPerSecond) is called after each chunk. The PS
+	coordinates are taken from points (a PSDump), if given.
+	"""
+	names, headerLength = readHeader(path)
+	columns = TSColumns(names, **fields)
+	hasPasses = columns.passage is not None
+	stats = ImportStats()
+	started = time.time()
+
+	# first pass: the sorted (code, pass) pairs and dates
+	keyDtype = np.dtype([('code', 'S%d' % MAX_CODE_WIDTH), ('passage', '<i4')])
+	keys = np.zeros(0, dtype=keyDtype)
+	ymd = np.zeros(0, dtype='<i4')
+	for offset, block in iterChunks(path, chunkSize, headerLength):
+		rows = parseTSChunk(block, columns)
+		chunkKeys = np.zeros(len(rows), dtype=keyDtype)
+		chunkKeys['code'] = rows['code']
+		if hasPasses:
+			chunkKeys['passage'] = rows['passage']
+		keys = np.unique( np.concatenate([keys, np.unique(chunkKeys)]) )
+		ymd = np.union1d( ymd, np.unique(rows['date']) )
+
+	width = max(1, int(np.char.str_len(keys['code']).max())) if len(keys) else 1
+	codes = np.unique( keys['code'] )
+	passes = np.unique( keys['passage'] )
+
+	def rowKeys(c, p):
+		# (code, pass) pairs as sortable integers
+		return np.searchsorted(codes, c) * len(passes) + np.searchsorted(passes, p)
+	allKeys = rowKeys( keys['code'], keys['passage'] )
+
+	# second pass: store each value at its (code and pass, date) cell
+	tmpPath = "%s.%d.tmp" % (cachePath, os.getpid())
+	flags = HAS_PASSES if hasPasses else 0
+	flags |= HAS_COORDS if points is not None else 0
+	cache = TSCacheFile.create( tmpPath, ymdToDatetime64(ymd), len(keys), width, flags=flags, key=key )
+	try:
+		cache.values[:] = np.nan
+		cache.codes[:] = keys['code'].astype('S%d' % width)
+		cache.passes[:] = keys['passage']
+		cache.fids[:] = np.arange(len(keys))
+		if points is not None:
+			cache.x[:], cache.y[:] = points.coordsOf( keys['code'], keys['passage'] if hasPasses else None )
+
+		for offset, block in iterChunks(path, chunkSize, headerLength):
+			rows = parseTSChunk(block, columns)
+			r = np.searchsorted( allKeys, rowKeys(rows['code'], rows['passage'] if hasPasses else 0) )
+			c = np.searchsorted( ymd, rows['date'] )
+			cache.values[r, c] = rows['value']
+
+			stats.rows += len(rows)
+			stats.seconds = time.time() - started
+			if progress:
+				progress( stats.rows, stats.rowsPerSecond )
+
+		cache.flush()
+	finally:
+		del cache
+	os.replace( tmpPath, cachePath )
+
+	stats.points, stats.dates = len(keys), len(ymd)
+	stats.seconds = time.time() - started
+	return stats
+
+
+INDEX_SUFFIX = ".tsidx.npz"
+
+
+def _lineBounds(block):
+	""" return the (start, end) byte offsets of the non blank lines of a block """
+	data = np.frombuffer(block, dtype=np.uint8)
+	ends = np.flatnonzero(data == 10) + 1
+	starts = np.r_[0, ends[:-1]]
+	# line length without the trailing \r\n
+	length = ends - starts - 1
+	length -= (length > 0) & (data[np.maximum(ends - 2, 0)] == 13)
+	nonBlank = length > 0
+	return starts[nonBlank], ends[nonBlank]
+
+
+class TextIndex:
+	"""
+	Sidecar index of a long-format time series text file: for each
+	(code, cod_passaggio) the byte ranges of its lines, so a lookup reads
+	and parses only the lines of that PS.
+	"""
+
+	def __init__(self, path, runs, names):
+		self.path = path
+		self.runs = runs
+		self.names = names
+		self.columns = TSColumns(names)
+		self._file = None
+		self._map = None
+
+	@staticmethod
+	def _stamp(path):
+		st = os.stat(path)
+		return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+	@classmethod
+	def build(cls, path, chunkSize=CHUNK_SIZE):
+		""" scan the whole file once, collecting the runs of lines of each PS """
+		names, headerLength = readHeader(path)
+		columns = TSColumns(names)
+		usecols = [columns.code] + ([columns.passage] if columns.passage is not None else [])
+		dtype = np.dtype([('code', 'S%d' % MAX_CODE_WIDTH), ('passage', '<i4')][:len(usecols)])
+
+		runs = []
+		for offset, block in iterChunks(path, chunkSize, headerLength):
+			starts, ends = _lineBounds(block)
+			keys = np.loadtxt( io.BytesIO(block), dtype=dtype, delimiter='\t', usecols=usecols, ndmin=1, comments=None )
+
+			# consecutive lines of the same PS and pass are a single range
+			change = np.r_[True, keys[1:] != keys[:-1]]
+			first = np.flatnonzero(change)
+			last = np.r_[first[1:], len(keys)] - 1
+
+			chunkRuns = np.zeros( len(first), dtype=[('code', 'S%d' % MAX_CODE_WIDTH), ('passage', '<i4'), ('start', '<i8'), ('end', '<i8')] )
+			chunkRuns['code'] = keys['code'][first]
+			if columns.passage is not None:
+				chunkRuns['passage'] = keys['passage'][first]
+			chunkRuns['start'] = offset + starts[first]
+			chunkRuns['end'] = offset + ends[last]
+			runs.append( chunkRuns )
+
+		runs = np.concatenate(runs) if runs else np.zeros(0, dtype=[('code', 'S1'), ('passage', '<i4'), ('start', '<i8'), ('end', '<i8')])
+		width = max(1, int(np.char.str_len(runs['code']).max())) if len(runs) else 1
+		runs = runs.astype([('code', 'S%d' % width), ('passage', '<i4'), ('start', '<i8'), ('end', '<i8')])
+		runs.sort(order=('code', 'passage', 'start'))
+		return cls(path, runs, names)
+
+	def save(self, indexPath=None):
+		np.savez( indexPath or self.path + INDEX_SUFFIX, runs=self.runs, stamp=self._stamp(self.path), names=np.array(self.names) )
+
+	@classmethod
+	def open(cls, path, indexPath=None):
+		""" load the sidecar index, (re)building it if missing or outdated """
+		indexPath = indexPath or path + INDEX_SUFFIX
+		if os.path.isfile(indexPath):
+			try:
+				with np.load(indexPath) as data:
+					if np.array_equal(data['stamp'], cls._stamp(path)):
+						return cls(path, data['runs'], [str(n) for n in data['names']])
+			except (IOError, OSError, ValueError, KeyError):
+				pass
+
+		index = cls.build(path)
+		try:
+			index.save(indexPath)
+		except (IOError, OSError):
+			pass	# read-only directory, keep it in memory
+		return index
+
+	def codes(self):
+		return np.unique(self.runs['code'])
+
+	def _ranges(self, code, passage=None):
+		if isinstance(code, str):
+			code = code.encode('utf-8')
+		if len(code) > self.runs.dtype['code'].itemsize:
+			# it would be truncated to the code of another PS
+			return self.runs[:0]
+		code = np.array(code, dtype=self.runs.dtype['code'])
+		lo = np.searchsorted(self.runs['code'], code, 'left')
+		hi = np.searchsorted(self.runs['code'], code, 'right')
+		runs = self.runs[lo:hi]
+		if passage is not None:
+			runs = runs[ runs['passage'] == passage ]
+		return runs
+
+	def lookup(self, code, passage=None):
+		""" return the parsed rows (code, date, value[, passage]) of a PS """
+		runs = self._ranges(code, passage)
+		usecols, dtype = self.columns.dtype()
+		if len(runs) == 0:
+			return np.zeros(0, dtype=dtype)
+
+		if self._map is None:
+			import mmap
+			self._file = open(self.path, 'rb')
+			self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		# the last line of the file may miss its newline, blank lines are skipped
+		block = b'\n'.join( self._map[s:e] for s, e in zip(runs['start'], runs['end']) )
+		return parseTSChunk(block, self.columns)
+
+	def series(self, code, passage=None):
+		""" return the (dates, values) arrays of a PS sorted by date """
+		rows = self.lookup(code, passage)
+		rows = rows[ np.argsort(rows['date'], kind='stable') ]
+		return ymdToDatetime64(rows['date']), rows['value']
+
+	def close(self):
+		if self._map is not None:
+			self._map.close()
+			self._file.close()
+		self._map = self._file = None
+
+
+# EWKB geometry type flags
+EWKB_Z = 0x80000000
+EWKB_M = 0x40000000
+EWKB_SRID = 0x20000000
+
+
+def decodeEWKBPoints(hexValues):
+	"""
+	decode a column of hex (E)WKB points at once, return the x, y and srid
+	arrays. Values that are not points get NaN coordinates.
+	"""
+	hexValues = np.char.strip( np.asarray(hexValues, dtype=np.bytes_) )
+	n = len(hexValues)
+	x = np.full(n, np.nan)
+	y = np.full(n, np.nan)
+	srid = np.zeros(n, dtype=np.int32)
+
+	lengths = np.char.str_len(hexValues)
+	for length in np.unique(lengths):
+		if length < 42 or length % 2:
+			continue	# shorter than a WKB point
+
+		# the records of the same length are decoded as a (n x bytes) matrix
+		rows = np.flatnonzero(lengths == length)
+		data = np.frombuffer( bytes.fromhex( b''.join(hexValues[rows]).decode('ascii') ), dtype=np.uint8 )
+		data = data.reshape( len(rows), length // 2 )
+
+		little = data[:, 0] == 1
+		def uint32(offset):
+			b = np.ascontiguousarray( data[:, offset:offset+4] )
+			return np.where( little, b.view('<u4')[:, 0], b.view('>u4')[:, 0] )
+
+		def float64(offsets):
+			b = np.take_along_axis( data, offsets[:, None] + np.arange(8), axis=1 )
+			# big endian values get their bytes reversed
+			b = np.where( little[:, None], b, b[:, ::-1] )
+			return np.ascontiguousarray(b).view('<f8')[:, 0]
+
+		geomType = uint32(1)
+		hasSrid = (geomType & EWKB_SRID) != 0
+		isPoint = (geomType & 0xFFFF) % 1000 == 1
+
+		xOffset = np.where( hasSrid, 9, 5 )
+		valid = isPoint & (xOffset + 16 <= data.shape[1])
+		xOffset = np.where( valid, xOffset, 0 )
+
+		x[ rows[valid] ] = float64(xOffset)[valid]
+		y[ rows[valid] ] = float64(xOffset + 8)[valid]
+		srid[ rows[hasSrid] ] = uint32(5)[hasSrid]
+
+	return x, y, srid
+
+
+def psDumpPath(tsPath):
+	"""
+	return the path of the attribute dump of the PS of a time series dump,
+	named as it without the ts_ prefix (all_asce.txt for ts_all_asce.txt),
+	None if there's none
+	"""
+	directory, name = os.path.split(tsPath)
+	if not name.lower().startswith("ts_"):
+		return None
+	path = os.path.join(directory, name[3:])
+	return path if os.path.isfile(path) else None
+
+
+class PSDump:
+	"""
+	Attribute dump of a PS dataset (like all_asce.txt), one row per PS with
+	the point geometry as hex EWKB. Columns are kept as NumPy arrays, the
+	numeric ones as float64 and the others as bytes.
+	"""
+
+	def __init__(self, names, columns, x, y, srid):
+		self.names = names
+		self.columns = columns
+		self.x, self.y, self.srid = x, y, srid
+
+	def __len__(self):
+		return len(self.x)
+
+	@classmethod
+	def fromFile(cls, path, geometryField="the_geom", chunkSize=CHUNK_SIZE):
+		names, headerLength = readHeader(path)
+		blocks = []
+		for offset, block in iterChunks(path, chunkSize, headerLength):
+			blocks.append( parseTableChunk(block) )
+		table = np.concatenate(blocks) if blocks else np.zeros( (0, len(names)), dtype='S1' )
+
+		columns = {}
+		for idx, name in enumerate(names):
+			col = np.char.strip( table[:, idx] )
+			try:
+				col = col.astype(np.float64)
+			except ValueError:
+				pass
+			columns[name] = col
+
+		if geometryField in columns:
+			x, y, srid = decodeEWKBPoints( columns.pop(geometryField) )
+		else:
+			x = y = np.full(len(table), np.nan)
+			srid = np.zeros(len(table), dtype=np.int32)
+		return cls(names, columns, x, y, srid)
+
+	def coordsOf(self, codes, passes=None):
+		"""
+		return the x, y of the given codes (NaN if unknown). With passes,
+		a PS is matched by code and cod_passaggio first, by code only then.
+		"""
+		codes = np.asarray(codes, dtype=np.bytes_)
+		x = np.full(len(codes), np.nan)
+		y = np.full(len(codes), np.nan)
+		if 'code' not in self.columns or len(self) == 0:
+			return x, y
+		dumpCodes = self.columns['code'].astype(np.bytes_)
+
+		def match(keys, dumpKeys, todo):
+			order = np.argsort(dumpKeys, kind='stable')
+			sortedKeys = dumpKeys[order]
+			pos = np.minimum( np.searchsorted(sortedKeys, keys[todo]), len(sortedKeys) - 1 )
+			found = sortedKeys[pos] == keys[todo]
+			rows = order[ pos[found] ]
+			x[ todo[found] ] = self.x[rows]
+			y[ todo[found] ] = self.y[rows]
+
+		todo = np.arange(len(codes))
+		if passes is not None and 'cod_passaggio' in self.columns:
+			sep = np.bytes_(b'|')
+			passKeys = np.char.add( np.char.add(codes, sep), np.asarray(passes).astype(np.bytes_) )
+			dumpPasses = self.columns['cod_passaggio'].astype(np.int64).astype(np.bytes_)
+			match( passKeys, np.char.add( np.char.add(dumpCodes, sep), dumpPasses ), todo )
+			todo = np.flatnonzero( np.isnan(x) )
+		match( codes, dumpCodes, todo )
+		return x, y
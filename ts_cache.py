@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import glob
+import shutil
+import hashlib
+import numpy as np
+
+from .ts_cube import TSCube
+
+
+MAGIC = b'PSTSCUBE'
+VERSION = 2
+
+# fixed size header at the beginning of each cache file, sections follow
+# it in this order, each one aligned to SECTION_ALIGN bytes
+HEADER_SIZE = 256
+SECTION_ALIGN = 64
+SECTIONS = ('dates', 'values', 'codes', 'fids', 'x', 'y', 'passes')
+
+# header flags
+HAS_COORDS = 0x1
+DELTA_ENCODED = 0x2
+HAS_PASSES = 0x4
+
+# storage types of the value matrix
+STORAGE_TYPES = { 'float32': '<f4', 'int16': '<i2', 'int32': '<i4' }
+
+HEADER_DTYPE = np.dtype([
+	('magic', 'S8'),
+	('version', '<u4'),
+	('flags', '<u4'),
+	('nPoints', '<u8'),
+	('nDates', '<u8'),
+	('valueType', 'S4'),
+	('codeWidth', '<u4'),
+	('scale', '<f8'),
+	('offsets', '<u8', (len(SECTIONS),)),
+	('key', 'S128'),
+])
+
+
+def defaultCacheDir():
+	""" return the directory where the cache files are stored """
+	from qgis.core import QgsSettings, QgsApplication
+	path = QgsSettings().value( "/pstimeseries/cacheDir", "" )
+	if not path:
+		path = os.path.join( QgsApplication.qgisSettingsDirPath(), "pstimeseries_cache" )
+	return path
+
+
+def cacheKey(source, stamp):
+	"""
+	return the key of a cached dataset: source is the layer source (or the
+	file path), stamp identifies its state (file mtime and size, see
+	fileStamp). Keys of the same source share the prefix.
+	"""
+	sourceHash = hashlib.sha1( source.encode('utf-8') ).hexdigest()[:16]
+	stampHash = hashlib.sha1( str(stamp).encode('utf-8') ).hexdigest()[:8]
+	return "%s-%s" % (sourceHash, stampHash)
+
+
+def fileStamp(path):
+	""" return the state of a file, it changes whenever the file is rewritten """
+	st = os.stat(path)
+	return "%d:%d" % (st.st_mtime_ns, st.st_size)
+
+
+def cachePath(key, cacheDir=None):
+	return os.path.join( cacheDir or defaultCacheDir(), key + ".pstc" )
+
+
+def purgeOutdated(key, cacheDir=None):
+	""" remove the cache files (or tiles) of the same source with another stamp """
+	prefix = key.split('-')[0]
+	for path in glob.glob( os.path.join(cacheDir or defaultCacheDir(), prefix + "-*") ):
+		if os.path.splitext(os.path.basename(path))[0] == key or path.endswith(".tmp"):
+			continue
+		try:
+			if os.path.isdir(path):
+				shutil.rmtree(path)
+			else:
+				os.remove(path)
+		except OSError:
+			pass	# maybe still mapped by another QGIS instance
+
+
+def quantize(values, scale, delta=False, valueType=None):
+	"""
+	encode float values as fixed point integers (value = q * scale), with
+	delta along time if requested. NaN are stored as the minimum integer.
+	If valueType is None the smallest of int16/int32 is chosen.
+	"""
+	values = np.asarray(values, dtype=np.float64)
+	nan = np.isnan(values)
+	q = np.rint( np.where(nan, 0, values) / scale ).astype(np.int64)
+
+	if delta:
+		if nan.any():
+			# NaN repeat the previous value, so their delta is 0
+			idx = np.where( nan, 0, np.arange(q.shape[-1]) )
+			idx = np.maximum.accumulate( idx, axis=-1 )
+			q = np.take_along_axis( q, idx, axis=-1 )
+		q = np.diff( q, axis=-1, prepend=0 )
+
+	lo, hi = (int(q.min()), int(q.max())) if q.size else (0, 0)
+	if valueType is None:
+		valueType = '<i2' if np.iinfo(np.int16).min < lo and hi <= np.iinfo(np.int16).max else '<i4'
+	info = np.iinfo( np.dtype(valueType) )
+	if lo <= info.min or hi > info.max:
+		raise ValueError( "values don't fit %s with scale %g" % (valueType, scale) )
+
+	q[nan] = info.min
+	return q.astype(valueType)
+
+
+def dequantize(q, scale, delta=False):
+	""" decode fixed point integers back to float32 values """
+	q = np.asarray(q)
+	nan = q == np.iinfo(q.dtype).min
+	v = np.where(nan, 0, q).astype(np.int64)
+	if delta:
+		v = np.cumsum( v, axis=-1 )
+	v = (v * scale).astype(np.float32)
+	v[nan] = np.nan
+	return v
+
+
+class QuantizedValues:
+	""" read-only float32 view of a fixed point value matrix, decoded by rows """
+
+	def __init__(self, raw, scale, delta=False):
+		self.raw = raw
+		self.scale = scale
+		self.delta = delta
+		self.shape = raw.shape
+		self.dtype = np.dtype(np.float32)
+
+	def __len__(self):
+		return len(self.raw)
+
+	@property
+	def nbytes(self):
+		return self.raw.nbytes
+
+	def __getitem__(self, index):
+		if isinstance(index, tuple):
+			# decode the whole rows, the deltas depend on the previous dates
+			rows, cols = index[0], index[1:]
+			return self[rows][ (Ellipsis,) + cols ]
+		return dequantize( self.raw[index], self.scale, self.delta )
+
+	def __array__(self, dtype=None, copy=None):
+		values = self[:]
+		return values if dtype is None else values.astype(dtype)
+
+	def inMemory(self):
+		""" return a copy not backed by the file """
+		return QuantizedValues( np.array(self.raw), self.scale, self.delta )
+
+
+class TSCacheFile:
+	"""
+	Time series cache stored in a single file: a header, the date vector,
+	the (n_points x n_dates) value matrix, the PS codes, the feature ids,
+	the coordinates and the acquisition passes. Sections are opened with numpy.memmap so the OS
+	page cache is shared by all the processes reading the same file.
+	"""
+
+	def __init__(self, path, mode='r'):
+		self.path = path
+		self.header = np.memmap( path, dtype=HEADER_DTYPE, mode='r', shape=(1,) )[0]
+		if self.header['magic'] != MAGIC or self.header['version'] != VERSION:
+			raise ValueError( "%s is not a time series cache file" % path )
+
+		self.key = self.header['key'].decode('utf-8')
+		self.flags = int(self.header['flags'])
+		nPoints, nDates = int(self.header['nPoints']), int(self.header['nDates'])
+		shapes = self._sectionShapes( nPoints, nDates )
+		dtypes = self._sectionDtypes( self.header['valueType'].decode('ascii'), int(self.header['codeWidth']) )
+
+		for name, offset in zip(SECTIONS, self.header['offsets']):
+			if np.prod(shapes[name]) == 0 or dtypes[name] is None:
+				section = np.empty( shapes[name], dtype=dtypes[name] or np.uint8 )
+			else:
+				section = np.memmap( path, dtype=dtypes[name], mode=mode, offset=int(offset), shape=shapes[name] )
+			setattr( self, name, section )
+
+		if int(self.header['codeWidth']) == 0:
+			self.codes = None
+
+		# fixed point values are decoded when rows are read
+		self.raw = self.values
+		if self.raw.dtype.kind == 'i':
+			self.values = QuantizedValues( self.raw, float(self.header['scale']), bool(self.flags & DELTA_ENCODED) )
+
+	@staticmethod
+	def _sectionShapes(nPoints, nDates):
+		shapes = dict( (name, (nPoints,)) for name in SECTIONS )
+		shapes['dates'] = (nDates,)
+		shapes['values'] = (nPoints, nDates)
+		return shapes
+
+	@staticmethod
+	def _sectionDtypes(valueType, codeWidth):
+		return {
+			'dates': np.dtype('<M8[D]'),
+			'values': np.dtype(valueType),
+			'codes': np.dtype('S%d' % codeWidth) if codeWidth > 0 else None,
+			'fids': np.dtype('<i8'),
+			'passes': np.dtype('<i4'),
+			'x': np.dtype('<f8'),
+			'y': np.dtype('<f8'),
+		}
+
+	def __len__(self):
+		return len(self.fids)
+
+	def read(self, rows=None):
+		""" return the float32 values of the requested rows """
+		if rows is None:
+			return np.asarray( self.values, dtype=np.float32 )
+		return np.asarray( self.values[ rows ], dtype=np.float32 )
+
+	def loadValues(self):
+		""" return the value matrix read into memory, in its storage format """
+		if isinstance(self.values, QuantizedValues):
+			return self.values.inMemory()
+		return np.array( self.values )
+
+	def flush(self):
+		for name in SECTIONS:
+			section = getattr(self, name) if name != 'values' else self.raw
+			if isinstance(section, np.memmap):
+				section.flush()
+
+	def toCube(self):
+		""" return a cube backed by the mapped sections, nothing is read now """
+		cube = TSCube( self.dates, self.values, self.fids )
+		cube.codes = self.codes
+		if self.flags & HAS_COORDS:
+			cube.x, cube.y = self.x, self.y
+		if self.flags & HAS_PASSES:
+			cube.passes = self.passes
+		return cube
+
+	@classmethod
+	def create(cls, path, dates, nPoints, codeWidth=0, valueType='<f4', scale=1.0, flags=0, key=""):
+		""" create an empty cache file, return it opened for writing """
+		nDates = len(dates)
+		shapes = cls._sectionShapes( nPoints, nDates )
+		dtypes = cls._sectionDtypes( valueType, codeWidth )
+
+		header = np.zeros( 1, dtype=HEADER_DTYPE )[0]
+		header['magic'] = MAGIC
+		header['version'] = VERSION
+		header['flags'] = flags
+		header['nPoints'] = nPoints
+		header['nDates'] = nDates
+		header['valueType'] = valueType.encode('ascii')
+		header['codeWidth'] = codeWidth
+		header['scale'] = scale
+		header['key'] = key.encode('utf-8')
+
+		offset = HEADER_SIZE
+		for i, name in enumerate(SECTIONS):
+			header['offsets'][i] = offset
+			if dtypes[name] is not None:
+				offset += int( np.prod(shapes[name]) ) * dtypes[name].itemsize
+			offset = (offset + SECTION_ALIGN - 1) // SECTION_ALIGN * SECTION_ALIGN
+
+		dirname = os.path.dirname(path)
+		if dirname and not os.path.isdir(dirname):
+			os.makedirs(dirname)
+
+		with open(path, 'wb') as f:
+			f.write( header.tobytes().ljust(HEADER_SIZE, b'\0') )
+			f.truncate( offset )
+
+		cache = cls( path, mode='r+' )
+		cache.dates[:] = dates
+		cache.x[:] = np.nan
+		cache.y[:] = np.nan
+		return cache
+
+	@classmethod
+	def write(cls, path, dates, values, codes=None, fids=None, x=None, y=None, key="", storage='float32', scale=0.01, delta=False):
+		"""
+		write a whole dataset, the file is replaced atomically. Values are
+		stored as float32 or, with the int16/int32 storage, as fixed point
+		integers (value = q * scale) optionally delta encoded along time.
+		"""
+		values = np.asarray(values)
+		codes = np.asarray(codes, dtype=np.bytes_) if codes is not None else None
+
+		flags = 0
+		valueType = STORAGE_TYPES[ storage ]
+		if storage != 'float32':
+			values = quantize( values, scale, delta, valueType )
+			flags |= DELTA_ENCODED if delta else 0
+		else:
+			scale = 1.0
+
+		hasCoords = x is not None and y is not None
+		flags |= HAS_COORDS if hasCoords else 0
+		tmpPath = "%s.%d.tmp" % (path, os.getpid())
+		cache = cls.create( tmpPath, dates, len(values), codes.dtype.itemsize if codes is not None else 0,
+				valueType=valueType, scale=scale, flags=flags, key=key )
+		try:
+			cache.raw[:] = values
+			if codes is not None:
+				cache.codes[:] = codes
+			cache.fids[:] = fids if fids is not None else np.arange(len(values))
+			if hasCoords:
+				cache.x[:] = x
+				cache.y[:] = y
+			cache.flush()
+		finally:
+			del cache
+		os.replace( tmpPath, path )
+
+		return cls( path )
+
+	@classmethod
+	def forKey(cls, key, cacheDir=None):
+		""" return the cache file for the key or None if not cached yet """
+		path = cachePath( key, cacheDir )
+		if not os.path.isfile(path):
+			return None
+		try:
+			cache = cls( path )
+		except (ValueError, OSError):
+			return None
+		return cache if cache.key == key else None
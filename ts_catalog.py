@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+from urllib.request import pathname2url
+
+from .ts_sources import quoteIdentifier
+from .ts_packing import PACKED_SUFFIX, DATES_COLUMN, VALUES_COLUMN
+
+
+# columns a table must have to hold the time series of the PS layers
+DB_COLUMNS = ("code", "dataripresa", "valore")				# PostGIS, SpatiaLite
+OCI_COLUMNS = ("id_dataset", "code_target", "data_misura", "spost_rel_mm")	# Oracle, VRT
+
+
+def _matches(fields, columns):
+	return set(columns).issubset( fields )
+
+
+def postgresTables(pool, connInfo, columns=DB_COLUMNS):
+	""" return a dict (schema, table) -> fields of the tables holding the columns """
+	wanted = ", ".join( "'%s'" % col for col in columns )
+	sql = ( "SELECT table_schema, table_name, array_agg(lower(column_name::text) ORDER BY ordinal_position) FROM information_schema.columns "
+			"WHERE table_schema NOT IN ('pg_catalog', 'information_schema') GROUP BY table_schema, table_name "
+			"HAVING array_agg(lower(column_name::text)) @> ARRAY[%s]" % wanted )
+	conn, prepared = pool.acquire( connInfo )
+	try:
+		cursor = conn.cursor()
+		cursor.execute( sql )
+		rows = cursor.fetchall()
+		cursor.close()
+	except Exception:
+		pool.release( connInfo, conn, prepared, broken=True )
+		raise
+	pool.release( connInfo, conn, prepared )
+	return dict( ((schema, table), tuple(fields)) for schema, table, fields in rows if not table.endswith( PACKED_SUFFIX ) )
+
+
+def sqliteTables(path, columns=DB_COLUMNS):
+	"""
+	return a dict table -> fields of the tables holding the columns, a
+	packed table whose long table has been dropped is listed by the name
+	of the long table (the key column, first, and the packed series)
+	"""
+	import sqlite3
+	conn = sqlite3.connect( "file:%s?mode=ro" % pathname2url(path), uri=True )
+	try:
+		tables = {}
+		names = [ row[0] for row in conn.execute( "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')" ).fetchall() ]
+		for name in names:
+			fields = tuple( row[1].lower() for row in conn.execute( "PRAGMA table_info(%s)" % quoteIdentifier(name) ) )
+			if not name.endswith( PACKED_SUFFIX ):
+				if _matches( fields, columns ):
+					tables[ name ] = fields
+			elif name[:-len(PACKED_SUFFIX)] not in names and _matches( fields, (columns[0], DATES_COLUMN, VALUES_COLUMN) ):
+				tables[ name[:-len(PACKED_SUFFIX)] ] = fields
+		return tables
+	finally:
+		conn.close()
+
+
+def oracleTables(uri, columns=OCI_COLUMNS):
+	""" return a dict owner.table -> fields of the tables holding the columns, through OGR """
+	from osgeo import ogr
+	ds = ogr.Open( uri )
+	if ds is None:
+		raise ValueError( "unable to open the Oracle connection" )
+	wanted = ", ".join( "'%s'" % col.upper() for col in columns )
+	# the tables are found first, then their fields
+	result = ds.ExecuteSQL( "SELECT c.owner, c.table_name, c.column_name FROM all_tab_columns c WHERE (c.owner, c.table_name) IN "
+			"(SELECT owner, table_name FROM all_tab_columns WHERE column_name IN (%s) GROUP BY owner, table_name HAVING COUNT(DISTINCT column_name) = %d) "
+			"ORDER BY c.owner, c.table_name, c.column_id" % (wanted, len(columns)) )
+	tables = {}
+	if result is not None:
+		for f in result:
+			tables.setdefault( "%s.%s" % (f.GetField(0), f.GetField(1)), [] ).append( f.GetField(2).lower() )
+		ds.ReleaseResultSet( result )
+	return dict( (name, tuple(fields)) for name, fields in tables.items() )
+
+
+def vrtTables(directory, columns=OCI_COLUMNS):
+	""" return a dict file name -> fields of the VRT files of a directory holding the columns """
+	from osgeo import ogr
+	tables = {}
+	for name in sorted( os.listdir(directory) ):
+		if not name.lower().endswith( ".vrt" ):
+			continue
+		ds = ogr.Open( os.path.join(directory, name) )
+		if ds is None or ds.GetLayerCount() == 0:
+			continue
+		# only the header of the underlying file is read
+		defn = ds.GetLayer(0).GetLayerDefn()
+		fields = tuple( defn.GetFieldDefn(i).GetName().lower() for i in range( defn.GetFieldCount() ) )
+		if _matches( fields, columns ):
+			tables[ name ] = fields
+	return tables
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import numpy as np
+
+from .ts_dates import dateFieldIndexes
+
+
+class TSCube:
+	"""
+	Displacement values of a whole PS layer held as a single
+	(n_points x n_dates) float32 array, sharing one date vector.
+	"""
+
+	def __init__(self, dates, values, fids=None):
+		self.dates = np.asarray(dates, dtype='datetime64[D]')
+		self.values = values
+		if fids is None:
+			fids = np.arange(len(values), dtype=np.int64)
+		self.fids = np.asarray(fids, dtype=np.int64)
+		self.infoFields = {}
+		# PS codes, acquisition passes and point coordinates aligned with
+		# the rows, if known
+		self.codes = None
+		self.passes = None
+		self.x = self.y = None
+
+		# fid -> row index: a sorted copy of the fids is enough to find the
+		# row with a binary search, no need to hold a dict of Python ints
+		if len(self.fids) and np.all(self.fids[1:] > self.fids[:-1]):
+			self._order = None
+			self._sortedFids = self.fids
+		else:
+			self._order = np.argsort(self.fids, kind='stable')
+			self._sortedFids = self.fids[self._order]
+
+	def __len__(self):
+		return len(self.fids)
+
+	def rowOf(self, fid):
+		""" return the row containing the feature fid or None """
+		pos = int(np.searchsorted(self._sortedFids, fid))
+		if pos >= len(self._sortedFids) or self._sortedFids[pos] != fid:
+			return None
+		return pos if self._order is None else int(self._order[pos])
+
+	def series(self, fid):
+		""" return the (dates, values) arrays of the feature fid or None """
+		row = self.rowOf(fid)
+		if row is None:
+			return None
+		return self.dates, np.asarray(self.values[row], dtype=np.float32)
+
+	def points(self):
+		""" return the (fids, x, y) arrays or None if coordinates are unknown """
+		if self.x is None or self.y is None:
+			return None
+		return self.fids, self.x, self.y
+
+	@classmethod
+	def fromDbf(cls, reader, shpReader=None):
+		""" load the D######## fields of a memory-mapped .dbf file """
+		# OGR uses the record number as feature id for shapefiles
+		cube = cls( reader.dates, reader.series() )
+
+		if shpReader is not None and len(shpReader) == len(reader):
+			x, y = shpReader.points()
+			# deleted records can't be found on the map
+			deleted = reader.deleted()
+			x[ deleted ] = np.nan
+			y[ deleted ] = np.nan
+			cube.x, cube.y = x, y
+
+		return cube
+
+	@classmethod
+	def fromLayer(cls, layer):
+		""" load all the D######## fields of a vector layer at once """
+		from qgis.core import QgsFeatureRequest
+
+		fields = layer.dataProvider().fields()
+		dateIdxs, dates = dateFieldIndexes( [fld.name() for fld in fields] )
+
+		request = QgsFeatureRequest()
+		request.setFlags( QgsFeatureRequest.NoGeometry )
+		request.setSubsetOfAttributes( dateIdxs )
+
+		count = max(layer.featureCount(), 0)
+		values = np.empty( (count, len(dateIdxs)), dtype=np.float32 )
+		fids = np.empty( count, dtype=np.int64 )
+
+		row = 0
+		for f in layer.getFeatures( request ):
+			if row >= len(fids):
+				# the provider count was an estimate, make room for more rows
+				values = np.resize( values, (2*row+1, len(dateIdxs)) )
+				fids = np.resize( fids, 2*row+1 )
+			attrs = f.attributes()
+			try:
+				values[row] = [ attrs[idx] for idx in dateIdxs ]
+			except TypeError:
+				# NULL values
+				values[row] = [ np.nan if attrs[idx] == None else attrs[idx] for idx in dateIdxs ]
+			fids[row] = f.id()
+			row += 1
+
+		cube = cls( dates, values[:row], fids[:row] )
+		skip = set(dateIdxs)
+		cube.infoFields = dict( (idx, fld) for idx, fld in enumerate(fields) if idx not in skip )
+		return cube
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+import numpy as np
+
+
+# fields containing time series values are named like D20030317
+DATE_FIELD_RE = re.compile( r"D(\d{8})", re.IGNORECASE )
+
+
+def ymdToDatetime64(values):
+	""" convert yyyyMMdd integers or strings to a datetime64[D] array """
+	ymd = np.asarray(values)
+	if ymd.dtype.kind in 'SU':
+		ymd = ymd.astype(np.int64)
+	ymd = ymd.astype(np.int64, copy=False)
+
+	years = ymd // 10000
+	months = ymd // 100 % 100
+	days = ymd % 100
+
+	dates = (years - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+	dates = dates + (months - 1).astype('timedelta64[M]')
+	return dates.astype('datetime64[D]') + (days - 1).astype('timedelta64[D]')
+
+
+def dateFieldIndexes(names):
+	""" return the (indexes, dates) of the fields named like D######## """
+	indexes, ymd = [], []
+	for idx, name in enumerate(names):
+		m = DATE_FIELD_RE.search( name )
+		if m is None:
+			continue
+		indexes.append( idx )
+		ymd.append( int(m.group(1)) )
+	return indexes, ymdToDatetime64( np.array(ymd, dtype=np.int64) )
+
+
+def toDatetime64(values):
+	"""
+	convert the date values read from a data provider (yyyyMMdd numbers
+	or strings, ISO strings, QDate or QDateTime) to a datetime64[D] array
+	"""
+	if len(values) == 0:
+		return np.zeros( 0, dtype='datetime64[D]' )
+
+	first = values[0]
+	if hasattr(first, 'toPyDateTime'):
+		return np.array( [v.toPyDateTime() for v in values], dtype='datetime64[D]' )
+	if hasattr(first, 'toPyDate'):
+		return np.array( [v.toPyDate() for v in values], dtype='datetime64[D]' )
+
+	values = np.asarray(values)
+	if values.dtype.kind in 'iu' or (values.dtype.kind in 'SU' and np.all( np.char.str_len(values) == 8 )):
+		return ymdToDatetime64( values )
+	return values.astype('datetime64[D]')
+
+
+def datetime64ToYmd(dates):
+	""" convert a datetime64 array to yyyyMMdd integers """
+	days = np.asarray(dates, dtype='datetime64[D]')
+	months = days.astype('datetime64[M]')
+	years = days.astype('datetime64[Y]').astype(np.int64) + 1970
+	return years * 10000 + (months.astype(np.int64) % 12 + 1) * 100 + (days - months).astype(np.int64) + 1
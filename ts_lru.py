@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+from collections import OrderedDict
+
+
+# memory budget of the shared cache, in MB
+DEFAULT_BUDGET_MB = 64
+
+# bookkeeping bytes counted for each entry besides its arrays
+ENTRY_OVERHEAD = 256
+
+
+def seriesSize(passes):
+	""" return the bytes held by a dict pass -> (dates, values) """
+	return ENTRY_OVERHEAD + sum( dates.nbytes + values.nbytes for dates, values in passes.values() )
+
+
+class SeriesCache:
+	"""
+	LRU cache of the series fetched by the clicks, a dict pass -> (dates,
+	values) by (PS layer source, TS table, PS key, dates window). The least
+	recently used entries are evicted once the size of the arrays exceeds
+	the budget, in bytes. The arrays are made read-only, as they are
+	shared by every plot showing them. It may be used by several threads.
+	"""
+
+	def __init__(self, budget):
+		self.budget = budget
+		self.hits = self.misses = 0
+		self._entries = OrderedDict()	# key -> (passes, size)
+		self._size = 0
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		""" return the cached series of key, None if not cached """
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry[0]
+
+	def put(self, key, passes):
+		for dates, values in passes.values():
+			dates.flags.writeable = False
+			values.flags.writeable = False
+		size = seriesSize(passes)
+
+		with self._lock:
+			old = self._entries.pop(key, None)
+			if old is not None:
+				self._size -= old[1]
+			if size > self.budget:
+				return
+			self._entries[key] = (passes, size)
+			self._size += size
+			self._evict()
+
+	def setBudget(self, budget):
+		with self._lock:
+			self.budget = budget
+			self._evict()
+
+	def _evict(self):
+		while self._size > self.budget and self._entries:
+			self._size -= self._entries.popitem(last=False)[1][1]
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._size = 0
+
+	def stats(self):
+		""" return the hit and miss counters and the size of the cache """
+		with self._lock:
+			return { 'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+					'bytes': self._size, 'budget': self.budget }
+
+
+_sharedCache = None
+
+
+def sharedCache():
+	""" return the cache shared by the whole QGIS session, its budget is read from the settings """
+	global _sharedCache
+	from qgis.core import QgsSettings
+	budget = QgsSettings().value( "/pstimeseries/seriesCacheMB", DEFAULT_BUDGET_MB, type=int ) * 1024 * 1024
+	if _sharedCache is None:
+		_sharedCache = SeriesCache( budget )
+	elif _sharedCache.budget != budget:
+		_sharedCache.setBudget( budget )
+	return _sharedCache
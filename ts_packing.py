@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import numpy as np
+
+from .ts_sources import quoteIdentifier, PASS_FIELD
+
+
+# the packed companion of a TS table holds a row per PS (and acquisition
+# pass, if the table has them), with the dates and values of its series
+# as arrays sorted by date
+PACKED_SUFFIX = "_packed"
+DATES_COLUMN = "dates"
+VALUES_COLUMN = "vals"
+
+
+def packedName(table):
+	return "%s%s" % (table, PACKED_SUFFIX)
+
+
+def qualifiedName(schema, table):
+	if schema:
+		return "%s.%s" % (quoteIdentifier(schema), quoteIdentifier(table))
+	return quoteIdentifier(table)
+
+
+def relationExists(cursor, schema, name):
+	""" check whether a table, view or materialized view exists """
+	cursor.execute( "SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = %s AND c.relname = %s",
+			(schema or 'public', name) )
+	return cursor.fetchone() is not None
+
+
+def relationColumns(cursor, schema, name):
+	""" return the columns of a table, view or materialized view """
+	cursor.execute( "SELECT a.attname FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+			"WHERE n.nspname = %s AND c.relname = %s AND a.attnum > 0 AND NOT a.attisdropped", (schema or 'public', name) )
+	return [ row[0].lower() for row in cursor.fetchall() ]
+
+
+def columnType(cursor, schema, table, column):
+	cursor.execute( "SELECT data_type FROM information_schema.columns WHERE table_schema = %s AND table_name = %s AND column_name = %s",
+			(schema or 'public', table, column) )
+	row = cursor.fetchone()
+	return row[0] if row else None
+
+
+def packTable(conn, schema, table, keyFields, dateField, valueField):
+	"""
+	Create the packed materialized view of a PostgreSQL TS table, or
+	refresh it if it exists. The long table stays the source of truth,
+	the view has to be refreshed after it's been changed.
+	Return True if the view has been created, False if refreshed.
+	"""
+	packed = packedName(table)
+	cursor = conn.cursor()
+	try:
+		# a PS acquired by several passes gets a row for each pass
+		hasPasses = columnType( cursor, schema, table, PASS_FIELD ) is not None
+		if relationExists( cursor, schema, packed ):
+			if not hasPasses or PASS_FIELD in relationColumns( cursor, schema, packed ):
+				# the unique index on the keys lets readers use the view meanwhile
+				cursor.execute( "REFRESH MATERIALIZED VIEW CONCURRENTLY %s" % qualifiedName(schema, packed) )
+				return False
+			# packed before the passes were kept apart
+			cursor.execute( "DROP MATERIALIZED VIEW %s" % qualifiedName(schema, packed) )
+
+		# yyyyMMdd dates are converted to date
+		dateExpr = quoteIdentifier(dateField)
+		if columnType( cursor, schema, table, dateField ) != 'date':
+			dateExpr = "to_date(%s::text, 'YYYYMMDD')" % dateExpr
+
+		keys = ", ".join( quoteIdentifier(fld) for fld in tuple(keyFields) + ((PASS_FIELD,) if hasPasses else ()) )
+		cursor.execute( "CREATE MATERIALIZED VIEW %s AS SELECT %s, array_agg(%s ORDER BY %s) AS %s, array_agg(%s::real ORDER BY %s) AS %s FROM %s GROUP BY %s" % (
+				qualifiedName(schema, packed), keys, dateExpr, dateExpr, DATES_COLUMN,
+				quoteIdentifier(valueField), dateExpr, VALUES_COLUMN, qualifiedName(schema, table), keys) )
+		cursor.execute( "CREATE UNIQUE INDEX %s ON %s (%s)" % (quoteIdentifier("%s_keys" % packed), qualifiedName(schema, packed), keys) )
+		cursor.execute( "ANALYZE %s" % qualifiedName(schema, packed) )
+		return True
+	finally:
+		cursor.close()
+
+
+def packBlobs(dates, values):
+	""" return the little-endian int32 days since 1970 and float32 values BLOBs of a series """
+	days = np.asarray(dates, dtype='datetime64[D]').astype('<i4')
+	return days.tobytes(), np.asarray(values, dtype='<f4').tobytes()
+
+
+def unpackBlobs(datesBlob, valuesBlob):
+	""" return the (dates, values) arrays of a packed series, as datetime64[D] and float64 like the other sources """
+	days = np.frombuffer(datesBlob, dtype='<i4')
+	return days.astype('datetime64[D]'), np.frombuffer(valuesBlob, dtype='<f4').astype(np.float64)
+
+
+def packSqliteTable(path, table, keyFields, dateField, valueField, progress=None, dropTable=False):
+	"""
+	Convert a long TS table of a SpatiaLite/GeoPackage database to its
+	packed companion, holding a row per PS (and pass) with the dates and
+	values of its series as BLOBs. The table is rebuilt if it exists.
+	With dropTable the long table is dropped and the database vacuumed,
+	the series are then read from the packed table alone, which can't be
+	rebuilt anymore. No other connection may be reading the database.
+	progress(packed, total) is called after each batch of PS.
+	Return the number of rows packed.
+	"""
+	import sqlite3
+	from .ts_sources import SqliteTSSource, BATCH_SIZE
+
+	packed = packedName(table)
+	probe = SqliteTSSource(path, table, keyFields, dateField, valueField, packed=False)
+	# a PS acquired by several passes gets a row for each pass
+	groups = tuple(keyFields) + ((PASS_FIELD,) if PASS_FIELD in probe.fields else ())
+	probe.close()
+	reader = SqliteTSSource(path, table, groups, dateField, valueField, packed=False)
+	if not reader.isValid():
+		reader.close()
+		raise ValueError( "%s: table %s or its fields not found" % (path, table) )
+
+	conn = sqlite3.connect(path)
+	try:
+		keys = ", ".join( quoteIdentifier(fld) for fld in groups )
+		allKeys = reader.conn.execute( "SELECT DISTINCT %s FROM %s" % (keys, quoteIdentifier(table)) ).fetchall()
+		if any( None in key for key in allKeys ):
+			raise ValueError( "%s: table %s has NULL %s values" % (path, table, ", ".join(groups)) )
+
+		conn.execute( "DROP TABLE IF EXISTS %s" % quoteIdentifier(packed) )
+		conn.execute( "CREATE TABLE %s (%s, %s BLOB, %s BLOB)" % (quoteIdentifier(packed), keys, DATES_COLUMN, VALUES_COLUMN) )
+		insert = "INSERT INTO %s VALUES (%s)" % ( quoteIdentifier(packed), ", ".join( ["?"] * (len(groups) + 2) ) )
+
+		for start in range(0, len(allKeys), BATCH_SIZE):
+			series = reader.fetchMany( allKeys[start:start+BATCH_SIZE] )
+			conn.executemany( insert, ( key + packBlobs(dates, values) for key, (dates, values) in series.items() ) )
+			if progress:
+				progress( min(start + BATCH_SIZE, len(allKeys)), len(allKeys) )
+
+		conn.execute( "CREATE UNIQUE INDEX %s ON %s (%s)" % (quoteIdentifier("%s_keys" % packed), quoteIdentifier(packed), keys) )
+
+		# GeoPackage readers only list the registered tables
+		gpkg = conn.execute( "SELECT 1 FROM sqlite_master WHERE name = 'gpkg_contents'" ).fetchone() is not None
+		if gpkg:
+			conn.execute( "INSERT OR REPLACE INTO gpkg_contents (table_name, data_type, identifier) VALUES (?, 'attributes', ?)", (packed, packed) )
+		conn.commit()
+
+		if dropTable:
+			# the pages of the long table are given back to the file system
+			reader.close()
+			conn.execute( "DROP TABLE %s" % quoteIdentifier(table) )
+			if gpkg:
+				conn.execute( "DELETE FROM gpkg_contents WHERE table_name = ?", (table,) )
+			conn.commit()
+			conn.execute( "VACUUM" )
+	finally:
+		conn.close()
+		reader.close()
+	return len(allKeys)
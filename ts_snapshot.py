@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+import numpy as np
+
+from .ts_dates import toDatetime64, datetime64ToYmd
+from .ts_sources import LayerTSSource, PASS_FIELD, quoteIdentifier, indexColumns, indexName
+
+
+# the snapshot of a time series table is a SQLite database in the cache
+# directory, with the rows in SNAPSHOT_TABLE (dates as yyyyMMdd integers)
+# and the state of the copy in INFO_TABLE
+SNAPSHOT_TABLE = "ts"
+INFO_TABLE = "snapshot_info"
+
+# rows inserted at once, committed one by one when a snapshot is built
+CHUNK_ROWS = 50000
+
+
+def snapshotPath(uri, cacheDir=None):
+	""" return the path of the snapshot of the table at uri, the uri (and its password) is only hashed """
+	from .ts_cache import defaultCacheDir
+	name = "snapshot_%s.sqlite" % hashlib.sha1( uri.encode('utf-8') ).hexdigest()[:16]
+	return os.path.join( cacheDir or defaultCacheDir(), name )
+
+
+def snapshotInfo(path):
+	""" return the dict of the state of a snapshot, empty if there's none """
+	if not os.path.isfile(path):
+		return {}
+	conn = sqlite3.connect(path)
+	try:
+		return dict( conn.execute( "SELECT name, value FROM %s" % INFO_TABLE ).fetchall() )
+	except sqlite3.Error:
+		return {}
+	finally:
+		conn.close()
+
+
+def _nullToNone(values):
+	# NULL attributes compare equal to None
+	return [ None if v == None else v for v in values ]
+
+
+def takeSnapshot(uri, providerType, keyFields, dateField, valueField, path=None, progress=None):
+	"""
+	Copy a time series table read through a data provider (Oracle through
+	OGR, or a VRT on a CSV file) to a local SQLite table indexed by the key
+	fields, readable by SqliteTSSource with the same field names.
+	If the snapshot exists, only the rows dated after its last date are
+	appended, in the same transaction as its new state so that a failure
+	leaves it untouched, otherwise it's built in a temporary file replaced
+	at the end.
+	progress(rows) is called after each chunk.
+	Return the number of rows copied, those without a date are skipped.
+	"""
+	path = path or snapshotPath(uri)
+	source = LayerTSSource( uri, providerType, keyFields, dateField, valueField )
+	if not source.isValid() or len(source.keyIdxs) != len(keyFields):
+		source.close()
+		raise ValueError( "the time series table or its fields weren't found" )
+
+	names = list(keyFields) + ([PASS_FIELD] if source.passIdx is not None else [])
+	attributes = source.keyIdxs + ([source.passIdx] if source.passIdx is not None else []) + [source.dateIdx, source.valueIdx]
+
+	info = snapshotInfo(path)
+	last = info.get("last_date")
+	window = None
+	if last is not None:
+		# new acquisitions only, the rows already copied aren't checked again
+		window = ( np.datetime64(last, 'D') + 1, np.datetime64('9999-12-31') )
+		target = path
+	else:
+		os.makedirs( os.path.dirname(path), exist_ok=True )
+		target = "%s.%d.tmp" % (path, os.getpid())
+		if os.path.exists(target):
+			os.remove(target)
+
+	conn = sqlite3.connect(target)
+	copied = 0
+	try:
+		table = quoteIdentifier(SNAPSHOT_TABLE)
+		if last is None:
+			# the keys keep the types of the provider
+			definition = ", ".join( [quoteIdentifier(name) for name in names] +
+					["%s INTEGER" % quoteIdentifier(dateField), "%s REAL" % quoteIdentifier(valueField)] )
+			conn.execute( "CREATE TABLE %s (%s)" % (table, definition) )
+			conn.execute( "CREATE TABLE %s (name TEXT PRIMARY KEY, value TEXT)" % INFO_TABLE )
+		insert = "INSERT INTO %s VALUES (%s)" % ( table, ", ".join( ["?"] * (len(names) + 2) ) )
+
+		def flush(rows):
+			# insert the rows with a date, return their number
+			rows = [ row for row in rows if row[-2] != None ]
+			if not rows:
+				return 0
+			columns = list(zip(*rows))
+			dates = toDatetime64( columns[-2] )
+			conn.executemany( insert, zip( *( [_nullToNone(col) for col in columns[:-2]] +
+					[ datetime64ToYmd(dates).tolist(), _nullToNone(columns[-1]) ] ) ) )
+			if target != path:
+				conn.commit()
+			newest.append( dates.max() )
+			return len(rows)
+
+		rows, newest = [], []
+		for row in source.iterRows( attributes, window ):
+			rows.append( row )
+			if len(rows) >= CHUNK_ROWS:
+				copied += flush(rows)
+				rows = []
+				if progress:
+					progress( copied )
+		copied += flush(rows)
+		if newest:
+			last = str( max(newest) )
+
+		columns = indexColumns( keyFields, names )
+		conn.execute( "CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (quoteIdentifier( indexName(SNAPSHOT_TABLE, columns) ),
+				table, ", ".join( quoteIdentifier(name) for name in columns )) )
+		state = { "last_date": last, "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+				"rows": str( conn.execute( "SELECT count(*) FROM %s" % table ).fetchone()[0] ) }
+		conn.executemany( "INSERT OR REPLACE INTO %s VALUES (?, ?)" % INFO_TABLE, [ item for item in state.items() if item[1] is not None ] )
+		conn.execute( "ANALYZE" )
+		conn.commit()
+	except Exception:
+		conn.rollback()
+		conn.close()
+		source.close()
+		if target != path:
+			os.remove(target)
+		raise
+	conn.close()
+	source.close()
+	if target != path:
+		os.replace( target, path )
+	return copied
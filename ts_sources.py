@@ -0,0 +1,1076 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from urllib.request import pathname2url
+import numpy as np
+
+from .ts_dates import toDatetime64, ymdToDatetime64
+
+
+def quoteIdentifier(name):
+	return '"%s"' % name.replace('"', '""')
+
+
+# largest number of keys sent in a single query
+BATCH_SIZE = 500
+
+# field holding the acquisition pass of the TS rows
+PASS_FIELD = "cod_passaggio"
+
+
+def emptySeries():
+	return toDatetime64([]), np.zeros( 0, dtype=np.float64 )
+
+
+def toSeries(dates, values):
+	""" return the (dates, values) arrays of the values read from a provider """
+	dates = toDatetime64(dates)
+	values = np.array( [np.nan if v == None else v for v in values], dtype=np.float64 )
+	return dates, values
+
+
+def windowSlice(dates, values, window):
+	""" return the part of a series within the (first, last) dates window, None is the whole series """
+	if window is None:
+		return dates, values
+	first, last = np.asarray(window, dtype='datetime64[D]')
+	mask = (dates >= first) & (dates <= last)
+	return dates[mask], values[mask]
+
+
+def windowBounds(window, ymd=True):
+	""" return the bounds of a dates window as yyyyMMdd or ISO strings """
+	first, last = np.asarray(window, dtype='datetime64[D]')
+	if ymd:
+		return first.item().strftime("%Y%m%d"), last.item().strftime("%Y%m%d")
+	return str(first), str(last)
+
+
+def groupSeries(keyColumns, dates, values, keys=()):
+	"""
+	split the rows of several PS by key, return a dict key -> (dates,
+	values) sorted by date. The requested keys not found get empty series.
+	"""
+	series = dict( (tuple(key), emptySeries()) for key in keys )
+	dates, values = toSeries(dates, values)
+	if len(dates) == 0:
+		return series
+
+	# number the keys, then sort the rows by key and date
+	group = np.zeros( len(dates), dtype=np.int64 )
+	for col in keyColumns:
+		uniq, inverse = np.unique( np.asarray(col), return_inverse=True )
+		group = group * len(uniq) + inverse.ravel()
+	order = np.lexsort( (dates, group) )
+	group, dates, values = group[order], dates[order], values[order]
+
+	starts = np.flatnonzero( np.r_[True, group[1:] != group[:-1]] )
+	ends = np.r_[starts[1:], len(group)]
+	for start, end in zip(starts, ends):
+		row = order[start]
+		series[ tuple( col[row] for col in keyColumns ) ] = ( dates[start:end], values[start:end] )
+	return series
+
+
+def passValue(value):
+	""" return a pass as a Python value, NULL attributes become None """
+	if value == None:
+		return None
+	return value.item() if isinstance(value, np.generic) else value
+
+
+def mergeSeries(series):
+	""" return the (dates, values) arrays of the parts of a series (e.g. its passes) merged and sorted by date """
+	if not series:
+		return emptySeries()
+	if len(series) == 1:
+		return series[0]
+	dates = np.concatenate( [dates for dates, values in series] )
+	values = np.concatenate( [values for dates, values in series] )
+	order = np.argsort( dates, kind='stable' )
+	return dates[order], values[order]
+
+
+def splitByPass(passes, dates, values):
+	"""
+	split the rows of a PS sorted by (pass, date) into a dict pass ->
+	(dates, values), ordered by pass
+	"""
+	passes = np.asarray(passes)
+	dates, values = toSeries(dates, values)
+	series = {}
+	if len(passes) == 0:
+		return series
+	starts = np.flatnonzero( np.r_[True, passes[1:] != passes[:-1]] )
+	ends = np.r_[starts[1:], len(passes)]
+	for start, end in zip(starts, ends):
+		series[ passValue( passes[start] ) ] = ( dates[start:end], values[start:end] )
+	return series
+
+
+def nestByPass(series, keys=()):
+	"""
+	nest the series of the (key fields..., pass) groups into a dict key ->
+	pass -> (dates, values), ordered by pass. The requested keys not
+	found get no passes.
+	"""
+	nested = dict( (tuple(key), {}) for key in keys )
+	for group, values in sorted( series.items(), key=lambda item: (item[0][-1] is None, item[0][-1]) ):
+		nested.setdefault( tuple(group[:-1]), {} )[ passValue(group[-1]) ] = values
+	return nested
+
+
+def indexColumns(keyFields, fields):
+	""" return the columns of the index serving the series lookups """
+	return tuple(keyFields) + ((PASS_FIELD,) if PASS_FIELD in fields else ())
+
+
+def indexName(table, columns):
+	return "idx_%s_%s" % (table.split(".")[-1], "_".join(columns))
+
+
+def coversKeys(indexes, keyFields):
+	""" return whether one of the indexes (tuples of columns) starts with the key fields """
+	n = len(keyFields)
+	return any( set( columns[:n] ) == set( keyFields ) for columns in indexes )
+
+
+# statistics of a series computed by the database, the trend line is
+# fitted on the days since 1970 as PlotGraph does
+STATS_FIELDS = ("slope", "intercept", "r2", "count", "mean", "std")
+
+
+def statsFromSums(rows, nKeys):
+	"""
+	return a dict key -> statistics (see STATS_FIELDS) of the (key
+	fields..., n, Sx, Sy, Sxx, Sxy, Syy) rows of a grouped query,
+	undefined values are None as the PostgreSQL regr_* functions return
+	"""
+	if not rows:
+		return {}
+	columns = list(zip(*rows))
+	n, sx, sy, sxx, sxy, syy = ( np.array(col, dtype=np.float64) for col in columns[nKeys:] )
+	with np.errstate(divide='ignore', invalid='ignore'):
+		varX = sxx - sx * sx / n
+		covXY = sxy - sx * sy / n
+		varY = syy - sy * sy / n
+		# all the dates equal, up to rounding errors
+		flat = varX <= 1e-12 * sxx
+		slope = np.where( flat, np.nan, covXY / varX )
+		intercept = (sy - slope * sx) / n
+		r2 = np.where( flat, np.nan, np.where( varY > 0, covXY * covXY / (varX * varY), 1.0 ) )
+		std = np.where( n > 1, np.sqrt( np.maximum(varY, 0) / (n - 1) ), np.nan )
+		mean = sy / n
+
+	stats = [ np.where( np.isnan(col), None, col ).tolist() for col in (slope, intercept, r2) ]
+	stats += [ n.astype(np.int64).tolist(), mean.tolist(), np.where( np.isnan(std), None, std ).tolist() ]
+	return dict( zip( zip(*columns[:nKeys]), zip(*stats) ) )
+
+
+def statsByPass(stats, hasPasses):
+	""" nest the statistics of the (key fields..., pass) groups into a dict key -> pass -> statistics """
+	nested = {}
+	for group, values in stats.items():
+		if hasPasses:
+			nested.setdefault( group[:-1], {} )[ passValue(group[-1]) ] = values
+		else:
+			nested[ group ] = { None: values }
+	return nested
+
+
+def _groupRows(rows, nKeys, keys=()):
+	""" group the (key fields..., date, value) rows of a batch query """
+	if not rows:
+		return groupSeries( [], [], [], keys )
+	columns = list(zip(*rows))
+	return groupSeries( columns[:nKeys], columns[nKeys], columns[nKeys+1], keys )
+
+
+def _batches(keys):
+	keys = [tuple(key) for key in keys]
+	for start in range(0, len(keys), BATCH_SIZE):
+		yield keys[start:start+BATCH_SIZE]
+
+
+class LayerTSSource:
+	"""
+	Time series table read through a vector layer opened once and kept for
+	the whole session, each series is fetched by a filtered request.
+	keyFields are the fields identifying a PS in the table.
+	"""
+
+	def __init__(self, uri, providerType, keyFields, dateField, valueField):
+		from qgis.core import QgsVectorLayer
+		from qgis.PyQt.QtCore import QVariant
+		self.keyFields = tuple(keyFields)
+		self.dateField, self.valueField = dateField, valueField
+		self.uri, self.providerType = uri, providerType
+		self.layer = QgsVectorLayer( uri, "time_series_layer", providerType )
+		self.feedback = None
+
+		self.dateIdx = self.valueIdx = self.passIdx = None
+		self.keyIdxs = []
+		self.fields = []
+		self.textDates = True
+		self.numericDates = False
+		if self.layer.isValid():
+			fields = self.layer.dataProvider().fields()
+			names = self.fields = [ fld.name().lower() for fld in fields ]
+			if dateField in names:
+				self.dateIdx = names.index(dateField)
+				dateType = fields[ self.dateIdx ].type()
+				self.textDates = dateType == QVariant.String
+				# yyyyMMdd numbers
+				self.numericDates = dateType in (QVariant.Int, QVariant.UInt, QVariant.LongLong, QVariant.ULongLong, QVariant.Double)
+			if valueField in names:
+				self.valueIdx = names.index(valueField)
+			if PASS_FIELD in names:
+				self.passIdx = names.index(PASS_FIELD)
+			self.keyIdxs = [ names.index(fld) for fld in self.keyFields if fld in names ]
+
+	def isValid(self):
+		return self.layer.isValid() and self.dateIdx is not None and self.valueIdx is not None
+
+	def _request(self, expr, attributes, window=None):
+		from qgis.core import QgsExpression, QgsFeatureRequest
+		if window is not None:
+			# yyyyMMdd strings and numbers are compared as they are
+			first, last = windowBounds( window, self.textDates or self.numericDates )
+			if self.textDates:
+				first, last = QgsExpression.quotedValue(first), QgsExpression.quotedValue(last)
+			elif not self.numericDates:
+				first, last = "to_date('%s')" % first, "to_date('%s')" % last
+			column = QgsExpression.quotedColumnRef(self.dateField)
+			expr = "(%s) AND %s >= %s AND %s <= %s" % (expr, column, first, column, last)
+
+		request = QgsFeatureRequest()
+		request.setFilterExpression( expr )
+		request.setFlags( QgsFeatureRequest.NoGeometry )
+		request.setSubsetOfAttributes( attributes )
+		if self.feedback is not None and hasattr( request, "setFeedback" ):
+			request.setFeedback( self.feedback )
+		return request
+
+	def _features(self, request):
+		# the reading stops once interrupted, also where the request has no feedback
+		for f in self.layer.getFeatures( request ):
+			if self.feedback is not None and self.feedback.isCanceled():
+				break
+			yield f
+
+	def request(self, key, window=None):
+		""" return the request of the features of a PS, sorted by date """
+		from qgis.core import QgsExpression
+		expr = " AND ".join( QgsExpression.createFieldEqualityExpression(fld, value) for fld, value in zip(self.keyFields, key) )
+		request = self._request( expr, [self.dateIdx, self.valueIdx], window )
+		request.addOrderBy( QgsExpression.quotedColumnRef(self.dateField) )
+		return request
+
+	def fetch(self, key, window=None):
+		""" return the (dates, values) arrays of the PS identified by key """
+		dates, values = [], []
+		for f in self._features( self.request(key, window) ):
+			a = f.attributes()
+			dates.append( a[ self.dateIdx ] )
+			values.append( a[ self.valueIdx ] )
+		return toSeries( dates, values )
+
+	def fetchByPass(self, key, window=None):
+		""" return a dict pass -> (dates, values) of the PS identified by key """
+		if self.passIdx is None:
+			return { None: self.fetch(key, window) }
+
+		from qgis.core import QgsExpression, QgsFeatureRequest
+		expr = " AND ".join( QgsExpression.createFieldEqualityExpression(fld, value) for fld, value in zip(self.keyFields, key) )
+		request = self._request( expr, [self.passIdx, self.dateIdx, self.valueIdx], window )
+		orderBy = QgsFeatureRequest.OrderBy( [ QgsFeatureRequest.OrderByClause( QgsExpression.quotedColumnRef(fld) ) for fld in (PASS_FIELD, self.dateField) ] )
+		request.setOrderBy( orderBy )
+
+		passes, dates, values = [], [], []
+		for f in self._features( request ):
+			a = f.attributes()
+			passes.append( a[ self.passIdx ] )
+			dates.append( a[ self.dateIdx ] )
+			values.append( a[ self.valueIdx ] )
+		return splitByPass( passes, dates, values )
+
+	def fetchMany(self, keys, window=None):
+		""" return a dict key -> (dates, values) of several PS read at once """
+		return self._fetchMany( keys, window )
+
+	def fetchManyByPass(self, keys, window=None):
+		""" return a dict key -> pass -> (dates, values) of several PS read at once """
+		if self.passIdx is None:
+			return dict( (key, { None: series }) for key, series in self._fetchMany( keys, window ).items() )
+		return nestByPass( self._fetchMany( keys, window, True ), keys )
+
+	def _fetchMany(self, keys, window, byPass=False):
+		# the series are grouped by key, and pass if byPass
+		from qgis.core import QgsExpression
+		groupIdxs = self.keyIdxs + ([self.passIdx] if byPass else [])
+		rows = []
+		for batch in _batches(keys):
+			if len(self.keyFields) == 1:
+				expr = "%s IN (%s)" % ( QgsExpression.quotedColumnRef(self.keyFields[0]),
+						", ".join( QgsExpression.quotedValue(key[0]) for key in batch ) )
+			else:
+				expr = " OR ".join( "(%s)" % " AND ".join( QgsExpression.createFieldEqualityExpression(fld, value)
+						for fld, value in zip(self.keyFields, key) ) for key in batch )
+
+			request = self._request( expr, groupIdxs + [self.dateIdx, self.valueIdx], window )
+			for f in self.layer.getFeatures( request ):
+				a = f.attributes()
+				rows.append( [ a[idx] for idx in groupIdxs ] + [ a[self.dateIdx], a[self.valueIdx] ] )
+
+		return _groupRows( rows, len(groupIdxs), () if byPass else keys )
+
+	def iterRows(self, attributes, window=None):
+		""" yield the values of the attributes (indexes) of every row of the table, within the dates window if given """
+		for f in self._features( self._request( "TRUE", attributes, window ) ):
+			a = f.attributes()
+			yield [ a[idx] for idx in attributes ]
+
+	def _oracleTable(self):
+		# the uri is like OCI:userid/password@database:owner.table
+		if self.providerType != 'ogr' or not self.uri.upper().startswith( "OCI:" ):
+			return None, None
+		table = self.uri.rsplit(':', 1)[-1].upper()
+		return tuple( table.split('.', 1) ) if '.' in table else (None, table)
+
+	def indexes(self):
+		""" return the columns of the indexes of the table, None if there's no catalog to read """
+		owner, table = self._oracleTable()
+		if table is None:
+			# e.g. a VRT on a CSV file, always scanned
+			return None
+
+		from osgeo import ogr
+		if owner:
+			sql = "SELECT index_name, column_name FROM all_ind_columns WHERE table_owner = '%s' AND table_name = '%s' ORDER BY index_name, column_position" % (owner, table)
+		else:
+			sql = "SELECT index_name, column_name FROM user_ind_columns WHERE table_name = '%s' ORDER BY index_name, column_position" % table
+		ds = ogr.Open( self.uri )
+		if ds is None:
+			return None
+		result = ds.ExecuteSQL( sql )
+		columns = {}
+		if result is not None:
+			for f in result:
+				columns.setdefault( f.GetField(0), [] ).append( f.GetField(1).lower() )
+			ds.ReleaseResultSet( result )
+		return [ tuple(cols) for cols in columns.values() ]
+
+	def createIndex(self):
+		""" create the index serving the series lookups """
+		owner, table = self._oracleTable()
+		if table is None:
+			raise ValueError( "indexes can't be created on %s" % self.uri )
+
+		from osgeo import ogr
+		columns = indexColumns( self.keyFields, self.fields )
+		# Oracle names are limited to 30 characters
+		name = indexName( table, columns )[:30].upper()
+		if owner:
+			name, table = "%s.%s" % (owner, name), "%s.%s" % (owner, table)
+		ds = ogr.Open( self.uri, True )
+		if ds is None:
+			raise ValueError( "unable to open %s" % self.uri )
+		ds.ExecuteSQL( "CREATE INDEX %s ON %s (%s)" % (name, table, ", ".join(columns)) )
+		ds = None
+
+	def threadSafe(self):
+		""" return a copy reading the layer through a QgsVectorLayerFeatureSource, usable out of the GUI thread """
+		import copy
+		from qgis.core import QgsVectorLayerFeatureSource, QgsFeedback
+		source = copy.copy(self)
+		source.layer = QgsVectorLayerFeatureSource( self.layer )
+		source.feedback = QgsFeedback()
+		return source
+
+	def interrupt(self, thread):
+		""" stop the requests of a threadSafe() copy """
+		if self.feedback is not None:
+			self.feedback.cancel()
+
+	def close(self):
+		self.layer = None
+
+
+class TextTSSource:
+	""" time series of a tab-delimited text table read through its byte-offset index """
+
+	keyFields = ("code",)
+
+	def __init__(self, index):
+		self.index = index
+
+	def isValid(self):
+		return self.index is not None
+
+	def fetch(self, key, window=None):
+		""" return the (dates, values) arrays of the PS identified by key """
+		dates, values = self.index.series( str(key[0]) )
+		return windowSlice( dates, values.astype(np.float64), window )
+
+	def fetchByPass(self, key, window=None):
+		""" return a dict pass -> (dates, values) of the PS identified by key """
+		rows = self.index.lookup( str(key[0]) )
+		if 'passage' not in rows.dtype.names:
+			return { None: self.fetch(key, window) }
+		rows = rows[ np.lexsort( (rows['date'], rows['passage']) ) ]
+		series = splitByPass( rows['passage'], ymdToDatetime64(rows['date']), rows['value'] )
+		return dict( (passage, windowSlice(dates, values, window)) for passage, (dates, values) in series.items() )
+
+	def fetchMany(self, keys, window=None):
+		""" return a dict key -> (dates, values) of several PS """
+		return dict( (tuple(key), self.fetch(key, window)) for key in keys )
+
+	def fetchManyByPass(self, keys, window=None):
+		""" return a dict key -> pass -> (dates, values) of several PS """
+		return dict( (tuple(key), self.fetchByPass(key, window)) for key in keys )
+
+	def indexes(self):
+		""" the lookups by code are served by the byte-offset index """
+		return [ self.keyFields ]
+
+	def threadSafe(self):
+		""" the index is read through a read-only memory map """
+		return self
+
+	def interrupt(self, thread):
+		""" a series is read at once from the local file """
+		pass
+
+	def close(self):
+		if self.index is not None:
+			self.index.close()
+		self.index = None
+
+
+class CubeTSSource:
+	"""
+	Time series of a long-format text table imported into a cache file
+	(see text_dumps.importLongFormat), a row for each PS and pass sorted
+	by code, read through its memory map.
+	"""
+
+	keyFields = ("code",)
+
+	def __init__(self, cache):
+		from .ts_cache import HAS_PASSES
+		self.cache = cache
+		self.hasPasses = cache is not None and bool( cache.flags & HAS_PASSES )
+
+	def isValid(self):
+		return self.cache is not None and self.cache.codes is not None
+
+	def _rows(self, key):
+		codes = self.cache.codes
+		code = str(key[0]).encode('utf-8')
+		if len(code) > codes.dtype.itemsize:
+			# no code that long was imported
+			return range(0)
+		return range( int(np.searchsorted(codes, code, 'left')), int(np.searchsorted(codes, code, 'right')) )
+
+	def _series(self, row, window):
+		# the dates missing for a PS are NaN in its row
+		values = np.asarray( self.cache.values[row], dtype=np.float64 )
+		known = ~np.isnan(values)
+		return windowSlice( self.cache.dates[known], values[known], window )
+
+	def fetch(self, key, window=None):
+		""" return the (dates, values) arrays of the PS identified by key """
+		return mergeSeries( [ self._series(row, window) for row in self._rows(key) ] )
+
+	def fetchByPass(self, key, window=None):
+		""" return a dict pass -> (dates, values) of the PS identified by key """
+		if not self.hasPasses:
+			return { None: self.fetch(key, window) }
+		return dict( (int(self.cache.passes[row]), self._series(row, window)) for row in self._rows(key) )
+
+	def fetchMany(self, keys, window=None):
+		""" return a dict key -> (dates, values) of several PS """
+		return dict( (tuple(key), self.fetch(key, window)) for key in keys )
+
+	def fetchManyByPass(self, keys, window=None):
+		""" return a dict key -> pass -> (dates, values) of several PS """
+		return dict( (tuple(key), self.fetchByPass(key, window)) for key in keys )
+
+	def indexes(self):
+		""" the lookups by code are binary searches on the sorted codes """
+		return [ self.keyFields ]
+
+	def threadSafe(self):
+		""" the cache file is read through a read-only memory map """
+		return self
+
+	def interrupt(self, thread):
+		""" a series is read at once from the local file """
+		pass
+
+	def close(self):
+		self.cache = None
+
+
+class SqliteTSSource:
+	"""
+	Time series table of a SpatiaLite/GeoPackage database read directly
+	with sqlite3, through read-only shared cache connections, one for each
+	thread reading it. The series query is the same for every PS, so
+	sqlite3 keeps it prepared.
+	"""
+
+	def __init__(self, path, table, keyFields, dateField, valueField, packed=True):
+		import sqlite3
+		import threading
+		from .ts_packing import packedName, DATES_COLUMN, VALUES_COLUMN
+		self.path, self.table = path, table
+		self.keyFields = tuple(keyFields)
+		self.dateField, self.valueField = dateField, valueField
+
+		self.uri = "file:%s?mode=ro&cache=shared" % pathname2url(path)
+		self._local = threading.local()
+		self._conns = {}	# thread id -> connection
+		self._lock = threading.Lock()
+		self._closed = False
+		self.fields = []
+		self.packed = False
+		self.hasLongTable = True
+		try:
+			self.fields = [ row[1].lower() for row in self.conn.execute( "PRAGMA table_info(%s)" % quoteIdentifier(table) ) ]
+			packedFields = []
+			if packed:
+				packedFields = [ row[1].lower() for row in self.conn.execute( "PRAGMA table_info(%s)" % quoteIdentifier( packedName(table) ) ) ]
+		except sqlite3.Error:
+			self.close()
+			return
+
+		# the long table may have been dropped once packed (see
+		# ts_packing.packSqliteTable), the fields and passes are then
+		# those of the packed table
+		self.hasLongTable = len(self.fields) > 0
+		if not self.hasLongTable:
+			self.fields = packedFields
+		if not self.isValid():
+			return
+
+		# read the BLOB-packed companion of the table if it exists, one
+		# packed without the passes of the table is ignored
+		self.packed = set(self.keyFields).issubset( packedFields ) and (PASS_FIELD in packedFields or PASS_FIELD not in self.fields)
+
+		# yyyyMMdd dates (text or integer) are cast and converted as integers
+		first = None
+		if self.hasLongTable:
+			first = self.conn.execute( "SELECT %s FROM %s LIMIT 1" % (quoteIdentifier(dateField), quoteIdentifier(table)) ).fetchone()
+		self.ymd = first is None or isinstance(first[0], int) or (isinstance(first[0], str) and len(first[0]) == 8 and first[0].isdigit())
+		self.dateExpr = "CAST(%s AS INTEGER)" % quoteIdentifier(dateField) if self.ymd else quoteIdentifier(dateField)
+
+		if self.packed:
+			self.source = quoteIdentifier( packedName(table) )
+			self.columns = "%s, %s" % (DATES_COLUMN, VALUES_COLUMN)
+		else:
+			self.source = quoteIdentifier(table)
+			self.columns = "%s, %s" % (self.dateExpr, quoteIdentifier(valueField))
+
+		where = " AND ".join( "%s=?" % quoteIdentifier(fld) for fld in self.keyFields )
+		self.query = self._select( self.columns, where )
+		self.windowQuery = self._select( self.columns, where, True )
+
+		# the passes are split by the query, sorted by pass (and date)
+		if self.packed:
+			self.passQuery = "SELECT %s, %s FROM %s WHERE %s ORDER BY %s" % (quoteIdentifier(PASS_FIELD),
+					self.columns, self.source, where, quoteIdentifier(PASS_FIELD))
+		else:
+			self.passQuery = "SELECT %s, %s, %s FROM %s WHERE %s%%s ORDER BY %s, %s" % (quoteIdentifier(PASS_FIELD),
+					self.dateExpr, quoteIdentifier(valueField), quoteIdentifier(table), where,
+					quoteIdentifier(PASS_FIELD), quoteIdentifier(dateField))
+
+	def _select(self, columns, where, window=False):
+		# the packed series are sorted and sliced once decoded
+		if self.packed:
+			return "SELECT %s FROM %s WHERE %s" % (columns, self.source, where)
+		if window:
+			where = "%s AND %s BETWEEN ? AND ?" % (where, self.dateExpr)
+		return "SELECT %s FROM %s WHERE %s ORDER BY %s" % (columns, self.source, where, quoteIdentifier(self.dateField))
+
+	def _bounds(self, window):
+		first, last = windowBounds( window, self.ymd )
+		return (int(first), int(last)) if self.ymd else (first, last)
+
+	def isValid(self):
+		from .ts_packing import DATES_COLUMN, VALUES_COLUMN
+		if self.hasLongTable:
+			needed = set(self.keyFields) | set([self.dateField, self.valueField])
+		else:
+			needed = set(self.keyFields) | set([DATES_COLUMN, VALUES_COLUMN])
+		return self.conn is not None and needed.issubset( self.fields )
+
+	def fetch(self, key, window=None):
+		""" return the (dates, values) arrays of the PS identified by key """
+		if window is None or self.packed:
+			rows = self.conn.execute( self.query, tuple(key) ).fetchall()
+		else:
+			rows = self.conn.execute( self.windowQuery, tuple(key) + self._bounds(window) ).fetchall()
+		if not rows:
+			return emptySeries()
+		if self.packed:
+			# a row for each pass, if packed by pass
+			from .ts_packing import unpackBlobs
+			return mergeSeries( [ windowSlice( *unpackBlobs( *row ), window=window ) for row in rows ] )
+		dates, values = zip(*rows)
+		return toDatetime64( dates ), np.array( values, dtype=np.float64 )
+
+	def fetchByPass(self, key, window=None):
+		""" return a dict pass -> (dates, values) of the PS identified by key """
+		if PASS_FIELD not in self.fields:
+			return { None: self.fetch(key, window) }
+		if self.packed:
+			from .ts_packing import unpackBlobs
+			rows = self.conn.execute( self.passQuery, tuple(key) ).fetchall()
+			return dict( (passValue(row[0]), windowSlice( *unpackBlobs( *row[1:] ), window=window )) for row in rows )
+		if window is None:
+			rows = self.conn.execute( self.passQuery % "", tuple(key) ).fetchall()
+		else:
+			rows = self.conn.execute( self.passQuery % (" AND %s BETWEEN ? AND ?" % self.dateExpr), tuple(key) + self._bounds(window) ).fetchall()
+		return splitByPass( *zip(*rows) ) if rows else {}
+
+	def fetchMany(self, keys, window=None):
+		""" return a dict key -> (dates, values) of several PS read at once """
+		return self._fetchMany( keys, window )
+
+	def fetchManyByPass(self, keys, window=None):
+		""" return a dict key -> pass -> (dates, values) of several PS read at once """
+		if PASS_FIELD not in self.fields:
+			return dict( (key, { None: series }) for key, series in self._fetchMany( keys, window ).items() )
+		return nestByPass( self._fetchMany( keys, window, True ), keys )
+
+	def _fetchMany(self, keys, window, byPass=False):
+		# the series are grouped by key, and pass if byPass
+		columns = ", ".join( quoteIdentifier(fld) for fld in self.keyFields )
+		groups = "%s, %s" % (columns, quoteIdentifier(PASS_FIELD)) if byPass else columns
+		bounds = self._bounds(window) if window is not None and not self.packed else ()
+		rows = []
+		for batch in _batches(keys):
+			if len(self.keyFields) == 1:
+				where = "%s IN (%s)" % ( columns, ", ".join( ["?"] * len(batch) ) )
+			else:
+				row = "(%s)" % ", ".join( ["?"] * len(self.keyFields) )
+				where = "(%s) IN (VALUES %s)" % ( columns, ", ".join( [row] * len(batch) ) )
+			query = self._select( "%s, %s" % (groups, self.columns), where, len(bounds) > 0 )
+			rows.extend( self.conn.execute( query, [value for key in batch for value in key] + list(bounds) ).fetchall() )
+
+		n = len(self.keyFields) + (1 if byPass else 0)
+		if self.packed:
+			from .ts_packing import unpackBlobs
+			parts = dict( (tuple(key), []) for key in keys ) if not byPass else {}
+			for row in rows:
+				parts.setdefault( tuple(row[:n]), [] ).append( windowSlice( *unpackBlobs( *row[n:] ), window=window ) )
+			return dict( (key, mergeSeries(series)) for key, series in parts.items() )
+		return _groupRows( rows, n, () if byPass else keys )
+
+	def statistics(self, window=None):
+		"""
+		return a dict key -> pass -> statistics (see STATS_FIELDS) of every
+		PS, summed by SQLite in a query grouped by PS and pass
+		"""
+		hasPasses = PASS_FIELD in self.fields
+		groups = self.keyFields + ((PASS_FIELD,) if hasPasses else ())
+		if not self.hasLongTable:
+			return statsByPass( self._packedStatistics( groups, window ), hasPasses )
+		keys = ", ".join( quoteIdentifier(fld) for fld in groups )
+		value = quoteIdentifier(self.valueField)
+		if self.ymd:
+			day = "julianday(printf('%%04d-%%02d-%%02d', %s / 10000, %s / 100 %% 100, %s %% 100))" % ((self.dateExpr,) * 3)
+		else:
+			day = "julianday(%s)" % self.dateExpr
+		where, bounds = "%s IS NOT NULL" % value, ()
+		if window is not None:
+			where, bounds = "%s AND %s BETWEEN ? AND ?" % (where, self.dateExpr), self._bounds(window)
+
+		# the days since 1970, as the datetime64[D] dates
+		query = ( "SELECT %s, count(*), sum(x), sum(v), sum(x * x), sum(x * v), sum(v * v) FROM "
+				"(SELECT %s, CAST(%s AS REAL) AS v, %s - 2440587.5 AS x FROM %s WHERE %s) GROUP BY %s" % (
+				keys, keys, value, day, quoteIdentifier(self.table), where, keys) )
+		return statsByPass( statsFromSums( self.conn.execute( query, bounds ).fetchall(), len(groups) ), hasPasses )
+
+	def _packedStatistics(self, groups, window):
+		# the sums of the grouped query, taken on the series decoded from
+		# the packed table
+		from .ts_packing import unpackBlobs
+		keys = ", ".join( quoteIdentifier(fld) for fld in groups )
+		rows = []
+		for row in self.conn.execute( "SELECT %s, %s FROM %s" % (keys, self.columns, self.source) ):
+			dates, values = windowSlice( *unpackBlobs( *row[-2:] ), window=window )
+			valid = ~np.isnan(values)
+			if not valid.any():
+				continue
+			# the days since 1970
+			x, v = dates[valid].astype(np.int64).astype(np.float64), values[valid]
+			rows.append( tuple(row[:-2]) + (len(v), x.sum(), v.sum(), (x * x).sum(), (x * v).sum(), (v * v).sum()) )
+		return statsFromSums( rows, len(groups) )
+
+	def _lookupTable(self):
+		# the table the series are read from
+		from .ts_packing import packedName
+		return packedName(self.table) if self.packed else self.table
+
+	def indexes(self):
+		""" return the columns of the indexes of the table read, the packed one if packed """
+		indexes = []
+		for row in self.conn.execute( "PRAGMA index_list(%s)" % quoteIdentifier( self._lookupTable() ) ).fetchall():
+			info = self.conn.execute( "PRAGMA index_info(%s)" % quoteIdentifier(row[1]) ).fetchall()
+			indexes.append( tuple( col[2].lower() for col in info if col[2] ) )
+		return indexes
+
+	def createIndex(self):
+		""" create the index serving the series lookups, through a writable connection """
+		import sqlite3
+		columns = indexColumns( self.keyFields, self.fields )
+		table = self._lookupTable()
+		conn = sqlite3.connect( self.path )
+		try:
+			conn.execute( "CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (quoteIdentifier( indexName(table, columns) ),
+					quoteIdentifier(table), ", ".join( quoteIdentifier(fld) for fld in columns )) )
+			conn.execute( "ANALYZE %s" % quoteIdentifier(table) )
+			conn.commit()
+		finally:
+			conn.close()
+
+	def threadSafe(self):
+		""" each thread reads through its own connection """
+		return self
+
+	@property
+	def conn(self):
+		""" the connection of the calling thread, opened on first use """
+		import sqlite3
+		import threading
+		conn = getattr( self._local, "conn", None )
+		if conn is None and not self._closed:
+			# closed by close() from whatever thread
+			conn = sqlite3.connect( self.uri, uri=True, check_same_thread=False )
+			self._local.conn = conn
+			with self._lock:
+				self._conns[ threading.get_ident() ] = conn
+		return conn
+
+	def interrupt(self, thread):
+		""" stop the query running on the connection of a thread, from another thread """
+		with self._lock:
+			conn = self._conns.get( thread )
+		if conn is not None:
+			conn.interrupt()
+
+	def close(self):
+		import threading
+		with self._lock:
+			conns, self._conns = self._conns, {}
+			self._closed = True
+			self._local = threading.local()
+		for conn in conns.values():
+			conn.close()
+
+
+def _psycopgConnect(connInfo):
+	import psycopg2
+	conn = psycopg2.connect( connInfo )
+	conn.autocommit = True
+	return conn
+
+
+class ConnectionPool:
+	"""
+	PostgreSQL connections kept open by connection info (the datasource
+	of the PS layers), with the statements already prepared on each one.
+	connect(connInfo) opens a DB-API connection, psycopg2 by default.
+	"""
+
+	def __init__(self, connect=None, maxIdle=4):
+		import threading
+		self.connect = connect or _psycopgConnect
+		self.maxIdle = maxIdle
+		self._idle = {}		# connInfo -> [(conn, prepared names)]
+		self._lock = threading.Lock()
+
+	def acquire(self, connInfo):
+		""" return a (connection, set of prepared statement names) pair """
+		with self._lock:
+			idle = self._idle.get(connInfo)
+			if idle:
+				return idle.pop()
+		return self.connect( connInfo ), set()
+
+	def release(self, connInfo, conn, prepared, broken=False):
+		""" give back a connection, the broken ones are closed """
+		if not broken:
+			with self._lock:
+				idle = self._idle.setdefault(connInfo, [])
+				if len(idle) < self.maxIdle:
+					idle.append( (conn, prepared) )
+					return
+		import psycopg2
+		try:
+			conn.close()
+		except psycopg2.Error as e:
+			from qgis.core import QgsMessageLog
+			QgsMessageLog.logMessage( "Unable to close a PostgreSQL connection: %s" % e, "PSTimeSeriesViewer" )
+
+	def close(self):
+		with self._lock:
+			idle, self._idle = self._idle, {}
+		for conns in idle.values():
+			for conn, prepared in conns:
+				conn.close()
+
+
+class PostgresTSSource:
+	"""
+	Time series table of a PostgreSQL database read through a connection
+	pool. The series query is prepared once on each connection and run
+	with EXECUTE, so the server doesn't plan it again at every click.
+	The packed companion of the table (see ts_packing) is read instead,
+	if it exists.
+	"""
+
+	def __init__(self, pool, connInfo, schema, table, keyFields, dateField, valueField):
+		import threading
+		import psycopg2
+		from .ts_packing import packedName, qualifiedName, DATES_COLUMN, VALUES_COLUMN
+		self.pool, self.connInfo = pool, connInfo
+		self._running = {}	# thread id -> connection of the query being run
+		self._lock = threading.Lock()
+		self.keyFields = tuple(keyFields)
+		self.dateField, self.valueField = dateField, valueField
+		self.schema, self.name = schema or 'public', table
+		self.table = qualifiedName(schema, table)
+
+		# check the table and its fields once
+		self.fields = []
+		self.packed = False
+		self.ymd = True
+		self.longTable = self.table
+		try:
+			rows = self._run( "SELECT column_name, data_type FROM information_schema.columns WHERE table_schema=%s AND table_name=%s",
+					(schema or 'public', table) )
+			self.fields = [ row[0].lower() for row in rows ]
+			self.ymd = not any( row[0].lower() == dateField and (row[1] == 'date' or row[1].startswith('timestamp')) for row in rows )
+			packedFields = [ row[0].lower() for row in self._run( "SELECT a.attname FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid "
+					"JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = %s AND c.relname = %s AND a.attnum > 0 AND NOT a.attisdropped",
+					(schema or 'public', packedName(table)) ) ]
+			# a view packed without the passes of the table is ignored
+			self.packed = set(self.keyFields).issubset( packedFields ) and (PASS_FIELD in packedFields or PASS_FIELD not in self.fields)
+		except psycopg2.Error as e:
+			# the source is then invalid
+			from qgis.core import QgsMessageLog
+			QgsMessageLog.logMessage( "Unable to read the time series table %s: %s" % (self.table, e), "PSTimeSeriesViewer" )
+
+		if self.packed:
+			# a single row per PS, with the series already sorted
+			self.table = qualifiedName(schema, packedName(table))
+			self.columns = "%s, %s" % (quoteIdentifier(DATES_COLUMN), quoteIdentifier(VALUES_COLUMN))
+		else:
+			self.columns = "%s, %s" % (quoteIdentifier(dateField), quoteIdentifier(valueField))
+
+		n = len(self.keyFields)
+		where = " AND ".join( "%s=$%d" % (quoteIdentifier(fld), i+1) for i, fld in enumerate(self.keyFields) )
+		self.query = self._select( self.columns, where )
+		self.windowQuery = self._select( self.columns, where, ("$%d" % (n+1), "$%d" % (n+2)) )
+
+		# the passes are split by the query, sorted by pass (and date)
+		if self.packed:
+			self.passQuery = "SELECT %s, %s FROM %s WHERE %s ORDER BY %s" % (quoteIdentifier(PASS_FIELD),
+					self.columns, self.table, where, quoteIdentifier(PASS_FIELD))
+		else:
+			self.passQuery = "SELECT %s, %s, %s FROM %s WHERE %s%%s ORDER BY %s, %s" % (quoteIdentifier(PASS_FIELD),
+					quoteIdentifier(dateField), quoteIdentifier(valueField), self.longTable, where,
+					quoteIdentifier(PASS_FIELD), quoteIdentifier(dateField))
+		self.passWindow = " AND %s BETWEEN $%d AND $%d" % (quoteIdentifier(dateField), n+1, n+2)
+
+	def _select(self, columns, where, window=None):
+		# the packed series are sorted and sliced once read
+		if self.packed:
+			return "SELECT %s FROM %s WHERE %s" % (columns, self.table, where)
+		if window is not None:
+			where = "%s AND %s BETWEEN %s AND %s" % ((where, quoteIdentifier(self.dateField)) + tuple(window))
+		return "SELECT %s FROM %s WHERE %s ORDER BY %s" % (columns, self.table, where, quoteIdentifier(self.dateField))
+
+	def _run(self, sql, params=(), prepare=False):
+		""" run a query, with prepare it's prepared once and run with EXECUTE """
+		import threading
+		conn, prepared = self.pool.acquire( self.connInfo )
+		thread = threading.get_ident()
+		with self._lock:
+			self._running[ thread ] = conn
+		try:
+			cursor = conn.cursor()
+			if prepare:
+				import hashlib
+				statement = "pstimeseries_%s" % hashlib.sha1( sql.encode('utf-8') ).hexdigest()[:16]
+				if statement not in prepared:
+					cursor.execute( "PREPARE %s AS %s" % (statement, sql) )
+					prepared.add( statement )
+				sql = "EXECUTE %s (%s)" % (statement, ", ".join( ["%s"] * len(params) ))
+			cursor.execute( sql, params )
+			rows = cursor.fetchall()
+			cursor.close()
+		except Exception:
+			self.pool.release( self.connInfo, conn, prepared, broken=True )
+			raise
+		finally:
+			with self._lock:
+				self._running.pop( thread, None )
+		self.pool.release( self.connInfo, conn, prepared )
+		return rows
+
+	def isValid(self):
+		needed = set(self.keyFields) | set([self.dateField, self.valueField])
+		return needed.issubset( self.fields )
+
+	def fetch(self, key, window=None):
+		""" return the (dates, values) arrays of the PS identified by key """
+		if window is None or self.packed:
+			rows = self._run( self.query, tuple(key), prepare=True )
+		else:
+			rows = self._run( self.windowQuery, tuple(key) + windowBounds(window, self.ymd), prepare=True )
+		if not rows:
+			return emptySeries()
+		if self.packed:
+			# a row for each pass, if packed by pass
+			return mergeSeries( [ windowSlice( toDatetime64( row[0] ), np.array( row[1], dtype=np.float64 ), window ) for row in rows ] )
+		dates, values = zip(*rows)
+		return toDatetime64( dates ), np.array( values, dtype=np.float64 )
+
+	def fetchByPass(self, key, window=None):
+		""" return a dict pass -> (dates, values) of the PS identified by key """
+		if PASS_FIELD not in self.fields:
+			return { None: self.fetch(key, window) }
+		if self.packed:
+			rows = self._run( self.passQuery, tuple(key), prepare=True )
+			return dict( (passValue(row[0]), windowSlice( toDatetime64( row[1] ), np.array( row[2], dtype=np.float64 ), window )) for row in rows )
+		if window is None:
+			rows = self._run( self.passQuery % "", tuple(key), prepare=True )
+		else:
+			rows = self._run( self.passQuery % self.passWindow, tuple(key) + windowBounds(window, self.ymd), prepare=True )
+		return splitByPass( *zip(*rows) ) if rows else {}
+
+	def fetchMany(self, keys, window=None):
+		""" return a dict key -> (dates, values) of several PS read at once """
+		return self._fetchMany( keys, window )
+
+	def fetchManyByPass(self, keys, window=None):
+		""" return a dict key -> pass -> (dates, values) of several PS read at once """
+		if PASS_FIELD not in self.fields:
+			return dict( (key, { None: series }) for key, series in self._fetchMany( keys, window ).items() )
+		return nestByPass( self._fetchMany( keys, window, True ), keys )
+
+	def _fetchMany(self, keys, window, byPass=False):
+		# the series are grouped by key, and pass if byPass
+		columns = ", ".join( quoteIdentifier(fld) for fld in self.keyFields )
+		groups = "%s, %s" % (columns, quoteIdentifier(PASS_FIELD)) if byPass else columns
+		bounds = windowBounds(window, self.ymd) if window is not None and not self.packed else ()
+		rows = []
+		for batch in _batches(keys):
+			if len(self.keyFields) == 1:
+				# a single array parameter, whatever the number of keys
+				where, params = "%s = ANY(%%s)" % columns, ( [key[0] for key in batch], )
+			else:
+				row = "(%s)" % ", ".join( ["%s"] * len(self.keyFields) )
+				where = "(%s) IN (%s)" % ( columns, ", ".join( [row] * len(batch) ) )
+				params = tuple( value for key in batch for value in key )
+			query = self._select( "%s, %s" % (groups, self.columns), where, ("%s", "%s") if bounds else None )
+			rows.extend( self._run( query, params + bounds ) )
+
+		n = len(self.keyFields) + (1 if byPass else 0)
+		if self.packed:
+			parts = dict( (tuple(key), []) for key in keys ) if not byPass else {}
+			for row in rows:
+				parts.setdefault( tuple(row[:n]), [] ).append( windowSlice( toDatetime64( row[n] ), np.array( row[n+1], dtype=np.float64 ), window ) )
+			return dict( (key, mergeSeries(series)) for key, series in parts.items() )
+		return _groupRows( rows, n, () if byPass else keys )
+
+	def statistics(self, window=None):
+		"""
+		return a dict key -> pass -> statistics (see STATS_FIELDS) of every
+		PS, computed by the server in a query grouped by PS and pass
+		"""
+		hasPasses = PASS_FIELD in self.fields
+		groups = self.keyFields + ((PASS_FIELD,) if hasPasses else ())
+		keys = ", ".join( quoteIdentifier(fld) for fld in groups )
+		date, value = quoteIdentifier(self.dateField), quoteIdentifier(self.valueField)
+		day = "to_date(%s::text, 'YYYYMMDD')" % date if self.ymd else "%s::date" % date
+		where, bounds = "%s IS NOT NULL" % value, ()
+		if window is not None:
+			where, bounds = "%s AND %s BETWEEN %%s AND %%s" % (where, date), windowBounds(window, self.ymd)
+
+		# the days since 1970, as the datetime64[D] dates
+		query = ( "SELECT %s, regr_slope(v, x), regr_intercept(v, x), regr_r2(v, x), count(v), avg(v), stddev_samp(v) FROM "
+				"(SELECT %s, %s::float8 AS v, (%s - DATE '1970-01-01')::float8 AS x FROM %s WHERE %s) AS s GROUP BY %s" % (
+				keys, keys, value, day, self.longTable, where, keys) )
+		n = len(groups)
+		return statsByPass( dict( (tuple(row[:n]), tuple(row[n:])) for row in self._run( query, bounds ) ), hasPasses )
+
+	def _lookupName(self):
+		# the name of the relation the series are read from
+		from .ts_packing import packedName
+		return packedName(self.name) if self.packed else self.name
+
+	def indexes(self):
+		""" return the columns of the indexes of the relation read, the packed view if packed """
+		import re
+		indexes = []
+		for row in self._run( "SELECT indexdef FROM pg_indexes WHERE schemaname=%s AND tablename=%s", (self.schema, self._lookupName()) ):
+			# e.g. CREATE INDEX name ON schema.table USING btree (code, cod_passaggio)
+			match = re.search( r"USING \w+ \((.*?)\)(?: INCLUDE| WITH| TABLESPACE| WHERE|$)", row[0] )
+			if match:
+				indexes.append( tuple( col.split()[0].strip('"').lower() for col in match.group(1).split(",") ) )
+		return indexes
+
+	def createIndex(self):
+		""" create the index serving the series lookups, without locking the table writes """
+		columns = indexColumns( self.keyFields, self.fields )
+		conn, prepared = self.pool.acquire( self.connInfo )
+		try:
+			cursor = conn.cursor()
+			# the pooled connections are in autocommit, as needed by CONCURRENTLY
+			cursor.execute( "CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s (%s)" % (quoteIdentifier( indexName(self._lookupName(), columns) ),
+					self.table, ", ".join( quoteIdentifier(fld) for fld in columns )) )
+			cursor.execute( "ANALYZE %s" % self.table )
+			cursor.close()
+		except Exception:
+			self.pool.release( self.connInfo, conn, prepared, broken=True )
+			raise
+		self.pool.release( self.connInfo, conn, prepared )
+
+	def threadSafe(self):
+		""" the connections are taken from the pool by each query """
+		return self
+
+	def interrupt(self, thread):
+		""" ask the server to cancel the query run by a thread, from another thread """
+		with self._lock:
+			conn = self._running.get( thread )
+		if conn is not None:
+			conn.cancel()
+
+	def close(self):
+		self.pool = None
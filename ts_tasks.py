@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import time
+import threading
+
+from qgis.core import QgsTask, QgsFeature, QgsFeatureRequest
+
+from .MapTools import FeatureFinder
+
+
+class ClickTask(QgsTask):
+	"""
+	Find the PS under a click and fetch its time series out of the GUI
+	thread. The PS layer is read through a QgsVectorLayerFeatureSource and
+	the time series through the threadSafe() copy of their source, both
+	made in the GUI thread. keyIdxs are the indexes of the key fields of
+	the PS layer. The series are looked for first in cache (see ts_lru) by
+	cacheScope + (key,). done(task, result) is called in the GUI thread,
+	unless the task has been canceled by a newer click, which also
+	interrupts the query of the series being fetched.
+	"""
+
+	def __init__(self, features, rect, center, done, points=None, tsSource=None, keyIdxs=None, window=None, cache=None, cacheScope=()):
+		QgsTask.__init__( self, "PS time series", QgsTask.CanCancel )
+		self.features = features
+		self.rect, self.center = rect, center
+		self.done = done
+		self.points = points
+		self.tsSource, self.keyIdxs = tsSource, keyIdxs
+		self.window = window
+		self.cache, self.cacheScope = cache, cacheScope
+
+		self.fid = self.attrs = self.key = None
+		self.passes = {}
+		self.cached = False
+		self.seconds = 0.0
+		self.error = None
+		self._fetching = None	# id of the thread fetching the series
+
+	def run(self):
+		try:
+			self.fid = FeatureFinder.closestFeatureId( self.features, self.rect, self.center, self.points )
+			if self.fid is None or self.isCanceled():
+				return not self.isCanceled()
+
+			request = QgsFeatureRequest( self.fid )
+			request.setFlags( QgsFeatureRequest.NoGeometry )
+			feat = QgsFeature()
+			self.features.getFeatures( request ).nextFeature( feat )
+			self.attrs = feat.attributes()
+			if self.tsSource is None or self.isCanceled():
+				return not self.isCanceled()
+
+			self.key = tuple( self.attrs[ idx ] for idx in self.keyIdxs )
+			if self.cache is not None:
+				passes = self.cache.get( self.cacheScope + (self.key,) )
+				if passes is not None:
+					self.passes, self.cached = passes, True
+					return not self.isCanceled()
+
+			started = time.time()
+			self._fetching = threading.get_ident()
+			try:
+				self.passes = self.tsSource.fetchByPass( self.key, self.window )
+			finally:
+				self._fetching = None
+			self.seconds = time.time() - started
+			if self.isCanceled():
+				# interrupted, the series may be incomplete
+				return False
+			if self.cache is not None:
+				self.cache.put( self.cacheScope + (self.key,), self.passes )
+		except Exception as e:
+			self.error = e
+			return False
+		return not self.isCanceled()
+
+	def cancel(self):
+		QgsTask.cancel( self )
+		thread = self._fetching
+		if thread is not None:
+			self.tsSource.interrupt( thread )
+
+	def finished(self, result):
+		if not self.isCanceled():
+			self.done( self, result )
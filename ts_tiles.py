@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+Name                : PS Time Series Viewer
+Description         : Computation and visualization of time series of speed for
+                    Permanent Scatterers derived from satellite interferometry
+Date                : Oct 17, 2026
+copyright           : (C) 2012 by Giuseppe Sucameli (Faunalia)
+email               : brush.tyler@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+from collections import OrderedDict
+import numpy as np
+
+from .ts_cube import TSCube
+from .ts_cache import TSCacheFile, cachePath
+
+
+INDEX_NAME = "tiles.npy"
+# the cell of the tile holding each feature, sorted by fid
+FIDS_NAME = "fids.npy"
+
+TILE_DTYPE = np.dtype([
+	('cell', '<i8'),
+	('count', '<i8'),
+	('xmin', '<f8'),
+	('ymin', '<f8'),
+	('xmax', '<f8'),
+	('ymax', '<f8'),
+])
+
+FID_DTYPE = np.dtype([
+	('fid', '<i8'),
+	('cell', '<i8'),
+])
+
+
+def tilesPath(key, cacheDir=None):
+	""" return the directory holding the tiles of a cached dataset """
+	return cachePath(key, cacheDir)[:-len(".pstc")] + ".tiles"
+
+
+def tileFileName(cell):
+	return "tile_%d.pstc" % cell
+
+
+def tilesExist(path):
+	""" check whether the tiles of a dataset have been built, with their indexes """
+	return os.path.isfile( os.path.join(path, INDEX_NAME) ) and os.path.isfile( os.path.join(path, FIDS_NAME) )
+
+
+def buildTiles(path, dates, readRows, fids, x, y, codes=None, pointsPerTile=20000, key="", **storage):
+	"""
+	Store a dataset as spatial tiles: the points are sorted by the cell of
+	a regular grid and each non empty cell is written as a cache file.
+	readRows(rows) returns the values of the requested rows, so the whole
+	value matrix is never held in memory. Points without coordinates are
+	skipped since they can't be shown on the map. The storage keywords
+	are passed to TSCacheFile.write.
+	"""
+	fids = np.asarray(fids)
+	located = np.flatnonzero( ~(np.isnan(x) | np.isnan(y)) )
+	tmpPath = "%s.%d.tmp" % (path, os.getpid())
+	if os.path.isdir(tmpPath):
+		shutil.rmtree(tmpPath)
+	os.makedirs(tmpPath)
+
+	tiles = np.zeros( 0, dtype=TILE_DTYPE )
+	fidCells = np.zeros( 0, dtype=FID_DTYPE )
+	if len(located):
+		lx, ly = x[located], y[located]
+		xmin, ymin = lx.min(), ly.min()
+		width = max(lx.max() - xmin, ly.max() - ymin, 1e-9)
+
+		# square cells holding pointsPerTile points on average
+		nCells = max(1, int(np.ceil( np.sqrt( float(len(located)) / pointsPerTile ) )))
+		cellSize = width / nCells * (1 + 1e-9)
+		ix = ((lx - xmin) / cellSize).astype(np.int64)
+		iy = ((ly - ymin) / cellSize).astype(np.int64)
+		cells = iy * nCells + ix
+
+		order = np.argsort(cells, kind='stable')
+		cells, rows = cells[order], located[order]
+		starts = np.flatnonzero( np.r_[True, cells[1:] != cells[:-1]] )
+		ends = np.r_[starts[1:], len(cells)]
+
+		fidCells = np.zeros( len(rows), dtype=FID_DTYPE )
+		fidCells['fid'], fidCells['cell'] = fids[rows], cells
+		fidCells.sort( order='fid' )
+
+		tiles = np.zeros( len(starts), dtype=TILE_DTYPE )
+		for i, (start, end) in enumerate(zip(starts, ends)):
+			tileRows = np.sort( rows[start:end] )
+			tx, ty = x[tileRows], y[tileRows]
+			tiles[i] = ( cells[start], len(tileRows), tx.min(), ty.min(), tx.max(), ty.max() )
+
+			TSCacheFile.write( os.path.join(tmpPath, tileFileName(cells[start])), dates, readRows(tileRows),
+					codes[tileRows] if codes is not None else None, fids[tileRows], tx, ty, key=key, **storage )
+
+	np.save( os.path.join(tmpPath, INDEX_NAME), tiles )
+	np.save( os.path.join(tmpPath, FIDS_NAME), fidCells )
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	os.rename(tmpPath, path)
+
+
+class TiledTSCube:
+	"""
+	Cube stored in spatial tiles: only the tiles intersecting the current
+	extent are read, the ones not used recently are evicted when more than
+	maxResident tiles are loaded. An extent covering more than maxResident
+	tiles loads none of them (overview): the series are then read from the
+	mapped tile holding them, found through the fid index, and the points
+	through the layer.
+	"""
+
+	def __init__(self, path, maxResident=64):
+		self.path = path
+		self.maxResident = max(1, maxResident)
+		self.tiles = np.load( os.path.join(path, INDEX_NAME) )
+		self.fidCells = np.load( os.path.join(path, FIDS_NAME), mmap_mode='r' )
+		self.infoFields = {}
+		self.codes = None
+
+		self._resident = OrderedDict()	# cell -> TSCube, least recently used first
+		self._visible = set()
+		self._points = None
+		self.overview = False
+
+		first = self._openTile( self.tiles['cell'][0] ) if len(self.tiles) else None
+		self.dates = first.dates if first is not None else np.zeros(0, dtype='datetime64[D]')
+
+	def __len__(self):
+		return int( self.tiles['count'].sum() )
+
+	def _openTile(self, cell):
+		return TSCacheFile( os.path.join(self.path, tileFileName(cell)) )
+
+	def _loadTile(self, cell):
+		cube = self._resident.get(cell)
+		if cube is not None:
+			self._resident.move_to_end(cell)
+			return cube
+
+		tile = self._openTile(cell)
+		cube = TSCube( tile.dates, tile.loadValues(), np.array(tile.fids) )
+		cube.x, cube.y = np.array(tile.x), np.array(tile.y)
+		if tile.codes is not None:
+			cube.codes = np.array(tile.codes)
+		self._resident[cell] = cube
+		self._points = None
+		return cube
+
+	def _evict(self):
+		for cell in list(self._resident.keys()):
+			if len(self._resident) <= self.maxResident:
+				break
+			if cell not in self._visible:
+				del self._resident[cell]
+				self._points = None
+
+	def tilesIn(self, xmin, ymin, xmax, ymax):
+		""" return the cells of the tiles intersecting the rectangle """
+		t = self.tiles
+		mask = (t['xmax'] >= xmin) & (t['xmin'] <= xmax) & (t['ymax'] >= ymin) & (t['ymin'] <= ymax)
+		return t['cell'][mask]
+
+	def setExtent(self, xmin, ymin, xmax, ymax):
+		""" load the tiles intersecting the extent, evict the unused ones """
+		cells = self.tilesIn(xmin, ymin, xmax, ymax)
+		# zoomed out, loading every tile on screen would hold the whole dataset
+		self.overview = len(cells) > self.maxResident
+		self._visible = set( cells.tolist() ) if not self.overview else set()
+		for cell in self._visible:
+			self._loadTile(cell)
+			self._evict()
+		self._evict()
+
+	def residentCount(self):
+		return len(self._resident)
+
+	def nbytes(self):
+		return sum( cube.values.nbytes for cube in self._resident.values() )
+
+	def points(self):
+		""" return the (fids, x, y) arrays of the resident tiles, None in overview """
+		if self.overview:
+			return None
+		if self._points is None:
+			cubes = list(self._resident.values())
+			if not cubes:
+				return None
+			self._points = tuple( np.concatenate([getattr(c, a) for c in cubes]) for a in ('fids', 'x', 'y') )
+		return self._points
+
+	def series(self, fid):
+		""" return the (dates, values) arrays of the feature fid or None """
+		for cell in reversed(list(self._resident.keys())):
+			series = self._resident[cell].series(fid)
+			if series is not None:
+				self._resident.move_to_end(cell)
+				return series
+
+		# not on screen, read it from the mapped tile holding it
+		pos = np.searchsorted( self.fidCells['fid'], fid )
+		if pos == len(self.fidCells) or self.fidCells['fid'][pos] != fid:
+			return None
+		cell = int( self.fidCells['cell'][pos] )
+		if cell in self._resident:
+			return None
+		tile = self._openTile(cell)
+		rows = np.flatnonzero( tile.fids == fid )
+		if not len(rows):
+			return None
+		return tile.dates, tile.read( int(rows[0]) )